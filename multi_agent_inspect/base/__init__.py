@@ -5,5 +5,22 @@ from .session import (
     Agent,
     Base,
     initialize_session,
+    initialize_async_session,
+    load_agents,
+    get_engine,
+    dispose_engines,
     Wrapper,
+    UnitOfWork,
+    history_loader,
 )
+from .writer import WriteBehindWriter, get_writer, close_writers
+from .base import Storage, AsyncUnitOfWork
+from .storage import (
+    ORMStorage,
+    AsyncORMStorage,
+    MemoryStorage,
+    HybridStorage,
+    open_storage,
+)
+from .history import set_rendering
+from .context import ContextPolicy, set_context_policy
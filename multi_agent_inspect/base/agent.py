@@ -0,0 +1,111 @@
+import random
+import string
+from chat import (
+    get_structured_json_response_from_gpt,
+    register_role,
+    request_tags,
+    span,
+)
+from .history import ChatHistory
+
+
+def display_name(agent_name: str) -> str:
+    """Suffixes an agent's name with a random id so agents with the same role differ."""
+    characters = (
+        string.ascii_letters + string.digits
+    )  # includes both upper/lower case letters and numbers
+    random_id = "".join(random.choices(characters, k=4))
+    # So that journals can recognise (and ignore) the suffix in requests
+    register_role(agent_name)
+    return agent_name + " " + random_id
+
+
+class AgentMixin:
+    """
+    Behaviour shared by every Agent implementation, whether it is a SQLAlchemy model
+    (`base.tables.Agent`) or a plain in-memory object (`base.memory.Agent`).
+    """
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return f"{self.agent_name} {self.agent_id}"
+
+    @property
+    def role(self) -> str:
+        """The agent's name without the random suffix added by `display_name`."""
+        return self.agent_name.rsplit(" ", 1)[0]
+
+    @property
+    def history(self) -> ChatHistory:
+        """The agent's incrementally maintained chat history."""
+        history = getattr(self, "_chat_history", None)
+        if history is None:
+            history = self._chat_history = ChatHistory(self)
+        return history
+
+    @property
+    def context_policy(self):
+        """The agent's own `ContextPolicy`, or None to use the default policy."""
+        return self.history.policy
+
+    @context_policy.setter
+    def context_policy(self, policy):
+        self.history.policy = policy
+
+    @property
+    def prompt_tokens(self) -> int:
+        """The tokens of the history the agent last read, i.e. sent with its last call."""
+        return self.history.prompt_tokens
+
+    @property
+    def chat_history(self):
+        # Chats are ordered by timestamp and converted into the format
+        # [{role: agent, content: chat_content}]
+        tags = {"agent": self.agent_id, "role": self.role}
+        with span("chat_history", "history", tags):
+            return self.history.messages()
+
+    def checkpoint(self):
+        """
+        Called at every forward boundary, e.g. to persist batched writes. May return an
+        awaitable, which `forward` awaits alongside the LLM call.
+        """
+        return None
+
+    async def forward(self, response_format, sample: int = 0, messages=None) -> dict:
+        """
+        Asks the model for a response from this agent's point of view: its chat history,
+        or `messages` if given (e.g. a snapshot taken by `Meeting.fan_out`). Independent
+        samples of the same conversation (e.g. for voting) should pass distinct `sample`
+        numbers, or the gateway may serve them a single shared response.
+        """
+
+        # logging.info(f"Agent {self.agent_name} is thinking...")
+
+        # Tags the agent's spans, and its request to the gateway, with the agent
+        with request_tags(agent=self.agent_id, role=self.role), span(
+            "forward", "agent", model=self.model
+        ):
+            committing = self.checkpoint()
+
+            try:
+                if messages is None:
+                    messages = self.chat_history
+
+                response_json = await get_structured_json_response_from_gpt(
+                    messages=messages,
+                    response_format=response_format,
+                    model=self.model,
+                    temperature=self.temperature,
+                    sample=sample,
+                    agent_id=self.agent_id,
+                    agent_role=self.role,
+                )
+            finally:
+                if committing is not None:
+                    await committing
+
+        # logging.info(f"Agent {self.agent_name} has responded with: \n{response_json}\n -------------------")
+
+        return response_json
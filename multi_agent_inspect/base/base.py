@@ -10,20 +10,57 @@ from sqlalchemy import (
     String,
 )
 from sqlalchemy.orm import object_session
+import asyncio
 import datetime
+import time
 from sqlalchemy.orm import Session
 from sqlalchemy.sql.sqltypes import String, DateTime
+from chat.tracing import span
 
 Base = declarative_base()
 
 
+class Storage:
+    """
+    A storage backend: decides which implementation of Agent, Meeting and Chat `Wrapper`
+    constructs and how (and when) they are persisted. Backends are context managers
+    scoped to a sample; see `base.storage` for the available implementations.
+
+    Methods:
+        create(cls, *args, **kwargs): Constructs the backend's implementation of `cls`.
+        close(): Ends the sample, persisting anything outstanding.
+    """
+
+    def create(self, cls, *args, **kwargs):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return self.__exit__(exc_type, exc_value, traceback)
+
+
 class Wrapper:
     """
     A class that wraps another class, injecting a session into its constructor.
 
+    The session may also be a `Storage`, in which case the storage constructs its own
+    implementation of the wrapped class (e.g. a plain in-memory object).
+
     Attributes:
         cls (type): The class to be wrapped.
-        session (Session): The session to be injected into the wrapped class.
+        session (Session | Storage): The session to be injected into the wrapped class.
 
     Methods:
         __call__(*args, **kwargs): Calls the wrapped class with the provided arguments,
@@ -35,10 +72,249 @@ class Wrapper:
         self.session = session
 
     def __call__(self, *args, **kwargs):
+        if isinstance(self.session, Storage):
+            return self.session.create(self.cls, *args, **kwargs)
         kwargs["session"] = self.session
         return self.cls(*args, **kwargs)
 
 
+class UnitOfWork:
+    """
+    Batches the commits issued by `CustomBase`, `CustomBase.update` and `AutoSaveList`.
+
+    Without a unit of work every Agent, Meeting and Chat is committed as soon as it is
+    created or appended to a relationship. While a unit of work is active for a session,
+    objects are only added to the session and committed together when `flush()` is
+    called, when `max_pending` objects have accumulated, or at the first forward boundary
+    after `max_interval` seconds. Autoflush is disabled for the duration so that pending
+    objects stay in memory (and out of SQLite's write lock) until the batch is committed;
+    relationship collections still hold the unflushed objects, so `Agent.chat_history`
+    sees every chat.
+
+    With a `writer` (see `base.writer.get_writer`) the session is never committed:
+    each flush snapshots the batch and hands it to the background writer, so no database
+    I/O happens on the caller's thread and reads are served from the objects in memory.
+    The objects are expunged from the session when the unit of work exits.
+
+    Usage:
+        with UnitOfWork(session):
+            await system.forward(task)
+
+    Attributes:
+        session (Session): The session whose commits are batched.
+        max_pending (int): Commit once this many objects have been added.
+        max_interval (float): Commit at the next forward boundary once this many seconds
+                              have passed since the last commit.
+        flush_on_forward (bool): Commit at every `Agent.forward` call.
+        writer (WriteBehindWriter): Optional writer that persists batches instead of the
+                                    session.
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        max_pending: int = 256,
+        max_interval: float = 5.0,
+        flush_on_forward: bool = False,
+        writer=None,
+    ):
+        self.session = session
+        self.max_pending = max_pending
+        self.max_interval = max_interval
+        self.flush_on_forward = flush_on_forward
+        self.writer = writer
+        self.batch = set()
+        self.last_flush = time.monotonic()
+        self._previous = None
+
+    @property
+    def pending(self):
+        """The number of objects added or updated since the last flush."""
+        return len(self.batch)
+
+    @staticmethod
+    def of(session):
+        """Returns the unit of work active for the session, if any."""
+        if session is None:
+            return None
+        return session.info.get("unit_of_work")
+
+    def __enter__(self):
+        self._previous = (
+            self.session.info.get("unit_of_work"),
+            self.session.autoflush,
+            self.session.expire_on_commit,
+        )
+        self.session.info["unit_of_work"] = self
+        self.session.autoflush = False
+        # Objects stay loaded after a batch commit, avoiding a reload per attribute access
+        self.session.expire_on_commit = False
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.flush()
+            if self.writer is not None:
+                # Everything has been handed to the writer; a later commit must not
+                # insert these objects again
+                self.session.expunge_all()
+        finally:
+            self._restore()
+        return False
+
+    def _restore(self):
+        previous, autoflush, expire_on_commit = self._previous
+        if previous is None:
+            self.session.info.pop("unit_of_work", None)
+        else:
+            self.session.info["unit_of_work"] = previous
+        self.session.autoflush = autoflush
+        self.session.expire_on_commit = expire_on_commit
+
+    def add(self, *objs):
+        """Adds objects to the session, committing only once the batch is full."""
+        self.session.add_all(objs)
+        self.batch.update(objs)
+        if self.pending >= self.max_pending:
+            self.flush()
+
+    def due(self) -> bool:
+        """Whether the batch should be committed at the next forward boundary."""
+        if not self.pending:
+            return False
+        overdue = time.monotonic() - self.last_flush >= self.max_interval
+        return self.flush_on_forward or overdue or self.pending >= self.max_pending
+
+    def checkpoint(self):
+        """
+        Called at forward boundaries; commits if the batch is due. Returns an awaitable
+        the caller must await before the batch's objects are modified again, or None.
+        """
+        if self.due():
+            self.flush()
+        return None
+
+    def flush(self):
+        """Commits every object added since the last flush."""
+        if self.batch and self.writer is not None:
+            with span("snapshot", "db", objects=len(self.batch)):
+                self.writer.submit(*self.batch)
+        elif self.batch:
+            with span("commit", "db", objects=len(self.batch)):
+                self.session.commit()
+        self.batch.clear()
+        self.last_flush = time.monotonic()
+
+
+class AsyncUnitOfWork(UnitOfWork):
+    """
+    A unit of work for an `AsyncSession` (e.g. on aiosqlite), so that no database I/O
+    blocks the event loop.
+
+    Adding objects never touches the database. Batches are committed at forward
+    boundaries: `checkpoint()` starts the commit as a task that `Agent.forward` awaits
+    together with its LLM call, so database latency overlaps with the LLM wait instead
+    of adding to it. Collections of new objects are initialised while they are still
+    pending, so later reads (e.g. building `Agent.chat_history`) never trigger an
+    implicit lazy load, which an `AsyncSession` cannot perform.
+
+    The session itself is never flushed: other samples' tasks keep adding objects and
+    appending to collections while a commit is in flight, which an ORM flush does not
+    allow. Instead, like the write-behind writer, a commit snapshots the batch's rows
+    synchronously and upserts them on a connection of its own; objects changed while
+    they are written are snapshotted again by the next commit. The objects are
+    expunged from the session when the unit of work exits.
+
+    Usage:
+        async with AsyncUnitOfWork(async_session):
+            await system.forward(task)
+
+    Attributes:
+        async_session (AsyncSession): The session whose commits are batched.
+    """
+
+    def __init__(self, session, **kwargs):
+        super().__init__(session.sync_session, **kwargs)
+        self.async_session = session
+        self._committing = None
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        try:
+            await self.aflush()
+            # Everything has been written; a later commit must not insert these
+            # objects again
+            self.session.expunge_all()
+        finally:
+            self._restore()
+        return False
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        raise TypeError("AsyncUnitOfWork must be used with 'async with'.")
+
+    def add(self, *objs):
+        """Adds objects to the session; they are committed at the next checkpoint."""
+        for obj in objs:
+            if obj not in self.batch and obj not in self.session:
+                # Initialise the pending object's collections (no SQL is emitted)
+                for relationship in obj.__mapper__.relationships:
+                    if relationship.uselist:
+                        getattr(obj, relationship.key)
+        self.session.add_all(objs)
+        self.batch.update(objs)
+
+    def checkpoint(self):
+        if self._committing is not None and not self._committing.done():
+            return self._committing
+        if not self.due():
+            return None
+        self._committing = asyncio.ensure_future(self._commit())
+        return self._committing
+
+    def flush(self):
+        raise TypeError("Use 'await AsyncUnitOfWork.aflush()'.")
+
+    async def aflush(self):
+        """Commits every object added since the last flush."""
+        if self._committing is not None:
+            await self._committing
+        await self._commit()
+
+    async def _commit(self):
+        # Imported here: the writer module builds on this one
+        from .writer import merge, snapshot, upsert
+
+        if self.batch:
+            # Objects added while the commit is in flight belong to the next batch
+            rows = merge([snapshot(*self.batch)])
+            objects = len(self.batch)
+            self.batch.clear()
+            with span("commit", "db", objects=objects):
+                async with self.async_session.bind.begin() as connection:
+                    await connection.run_sync(upsert, rows)
+        self.last_flush = time.monotonic()
+
+
+def save(session, *objs):
+    """
+    Adds objects to the session and commits them, or defers the commit to the unit of
+    work active for the session.
+    """
+    unit_of_work = UnitOfWork.of(session)
+    if unit_of_work is not None:
+        unit_of_work.add(*objs)
+    elif not isinstance(session, Session):
+        raise TypeError(
+            f"{type(session).__name__} can only be written to inside an AsyncUnitOfWork."
+        )
+    else:
+        with span("commit", "db", objects=len(objs)):
+            session.add_all(objs)
+            session.commit()
+
+
 class CustomBase(Base):
     __abstract__ = True
 
@@ -57,6 +333,9 @@ class CustomBase(Base):
                     setattr(self, column_name, column.default.arg)
                 elif isinstance(column_type, DateTime):
                     setattr(self, column_name, datetime.datetime.utcnow())
+                elif column.default.is_callable:
+                    # e.g. UUID primary keys, so objects are identifiable before a flush
+                    setattr(self, column_name, column.default.arg(None))
 
             # Validate provided values
             if column_name in kwargs:
@@ -70,11 +349,8 @@ class CustomBase(Base):
 
         if session:
             self.session = session
-            # Add self to the session and commit
-
-            session.add(self)
-
-            session.commit()
+            # Add self to the session and commit (or batch it in the unit of work)
+            save(session, self)
 
     def validate_column_value(self, column_name, column_type, value):
         """
@@ -136,8 +412,7 @@ class CustomBase(Base):
         session = object_session(self)
         for attr, value in kwargs.items():
             setattr(self, attr, value)
-        session.add(self)
-        session.commit()
+        save(session, self)
 
 
 class AutoSaveList(list):
@@ -146,14 +421,16 @@ class AutoSaveList(list):
         if item:
             session = object_session(item)
             if session:
-                session.add(item)
-                session.commit()
+                save(session, item)
 
     def extend(self, items):
+        items = list(items)
         super().extend(items)
+        if not items:
+            return
         session = object_session(items[0])
-        session.add_all(items)
-        session.commit()
+        if session:
+            save(session, *items)
 
 
 class CustomColumn(Column):
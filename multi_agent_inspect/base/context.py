@@ -0,0 +1,199 @@
+"""
+Context policies: how much of an agent's chat history is sent with each call.
+
+Without a policy every call sends the agent's whole history, so prompts grow with every
+turn of a meeting. A `ContextPolicy` is applied to the rendered history in
+`Agent.chat_history`; set one per agent (`agent.context_policy = ...`) or for every agent
+with `set_context_policy` (or the CONTEXT_* environment variables).
+"""
+
+import os
+
+from chat.tokens import DEFAULT_ENCODING_NAME, shared_counter
+
+REPEATED = "(repeated from above)"
+NOTE_HEADER = "Earlier messages, abridged:"
+
+# Histories are counted like the gateway counts them; the mock backend runs offline,
+# without the encoding
+ENCODING_NAME = (
+    None if os.getenv("GATEWAY_BACKEND") == "mock" else DEFAULT_ENCODING_NAME
+)
+
+
+class ContextPolicy:
+    """
+    Trims a history to fit a token budget. Each step is optional and applied in order:
+
+    1. `dedup`: text at the end of a message that repeats the end of an earlier one (at
+       least `min_repeat_chars` long, e.g. the task restated in every instruction) is
+       replaced with a short reference to it. Messages repeated whole are kept.
+    2. `window`: only the last `window` messages are kept.
+    3. `max_tokens`: the oldest messages are dropped until the history fits.
+
+    The first `keep_first` messages (usually the task) are always kept, as is the latest
+    message. With `compact`, the messages dropped by the window or the budget are replaced
+    by a single note quoting the start of each (up to `compact_chars` characters), which
+    also counts towards the budget.
+
+    Attributes:
+        max_tokens (int): The token budget of the history, or None.
+        window (int): The number of latest messages kept, or None.
+        dedup (bool): Replace repeated text with a reference to its first occurrence.
+        compact (bool): Summarise dropped messages instead of omitting them.
+        keep_first (int): The number of leading messages always kept.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = None,
+        window: int = None,
+        dedup: bool = False,
+        compact: bool = False,
+        keep_first: int = 1,
+        min_repeat_chars: int = 64,
+        compact_chars: int = 200,
+        encoding_name: str = ENCODING_NAME,
+    ):
+        self.max_tokens = max_tokens
+        self.window = window
+        self.dedup = dedup
+        self.compact = compact
+        self.keep_first = keep_first
+        self.min_repeat_chars = min_repeat_chars
+        self.compact_chars = compact_chars
+        self.counter = shared_counter(encoding_name)
+
+    @classmethod
+    def from_env(cls):
+        """The policy configured by CONTEXT_* environment variables, or None."""
+        max_tokens = os.getenv("CONTEXT_MAX_TOKENS")
+        window = os.getenv("CONTEXT_WINDOW")
+        dedup = os.getenv("CONTEXT_DEDUP", "0") != "0"
+        compact = os.getenv("CONTEXT_COMPACT", "0") != "0"
+        if max_tokens is None and window is None and not dedup:
+            return None
+        return cls(
+            max_tokens=int(max_tokens) if max_tokens else None,
+            window=int(window) if window else None,
+            dedup=dedup,
+            compact=compact,
+        )
+
+    def count(self, messages: list) -> int:
+        """The prompt tokens of a history, as the gateway counts them."""
+        return self.counter.count(messages)
+
+    def apply(self, messages: list) -> list:
+        """Returns the messages of `messages` to send, as new dicts where changed."""
+        if self.dedup:
+            messages = self.deduplicate(messages)
+        return self.trim(messages)
+
+    def trim(self, messages: list) -> list:
+        """Applies the window and the budget (but not `dedup`) to the messages."""
+        pinned = messages[: self.keep_first]
+        recent = messages[self.keep_first :]
+        dropped = []
+        if self.window is not None and len(recent) > self.window:
+            cut = len(recent) - max(self.window, 1)
+            dropped, recent = recent[:cut], recent[cut:]
+
+        if self.max_tokens is not None:
+            counts = self.counter.count_each(pinned + recent)
+            budget = self.max_tokens - sum(counts[: len(pinned)])
+            counts = counts[len(pinned) :]
+            used = sum(counts)
+            # The note grows by a line per dropped message, so its size is summed from
+            # theirs and the note itself built once the messages to drop are known
+            noted = self._note_tokens(dropped) if self.compact and dropped else 0
+            while len(recent) > 1 and used + noted > budget:
+                if self.compact:
+                    noted += self._note_tokens([recent[0]], header=not dropped)
+                dropped.append(recent.pop(0))
+                used -= counts.pop(0)
+
+        if self.compact and dropped:
+            note = self.note(dropped)
+            if self.max_tokens is not None:
+                # The summed size is close to, but not exactly, the note's own
+                while len(recent) > 1 and used + self._count_one(note) > budget:
+                    dropped.append(recent.pop(0))
+                    used -= counts.pop(0)
+                    note = self.note(dropped)
+            return pinned + [note] + recent
+        return pinned + recent
+
+    def deduplicate(self, messages: list, done: list = None) -> list:
+        """
+        Replaces the repeated endings of messages with a reference. `done`, the result
+        for a prefix of `messages` (e.g. before the latest messages arrived), is extended
+        rather than worked out again.
+        """
+        deduplicated = list(done) if done else []
+        for i in range(len(deduplicated), len(messages)):
+            message = messages[i]
+            content = message["content"]
+            for earlier in messages[:i]:
+                repeated = common_suffix(content, earlier["content"])
+                if repeated < self.min_repeat_chars:
+                    continue
+                # Cut at a word boundary
+                start = len(content) - repeated
+                while 0 < start < len(content) and not content[start - 1].isspace():
+                    start += 1
+                # Whole messages repeated (e.g. an instruction given every round) are
+                # kept, as they prompt the next turn
+                speaker = content.find(": ") + 2
+                if start > speaker and len(content) - start >= self.min_repeat_chars:
+                    content = content[:start] + REPEATED
+                    break
+            if content is not message["content"]:
+                message = {**message, "content": content}
+            deduplicated.append(message)
+        return deduplicated
+
+    def note(self, dropped: list) -> dict:
+        """A message abridging the dropped messages."""
+        return {
+            "role": "system",
+            "content": NOTE_HEADER + "".join(self._note_line(m) for m in dropped),
+        }
+
+    def _note_line(self, message: dict) -> str:
+        content = message["content"]
+        if len(content) > self.compact_chars:
+            content = content[: self.compact_chars].rstrip() + "..."
+        return "\n- " + content
+
+    def _note_tokens(self, dropped: list, header: bool = True) -> int:
+        # The tokens of the note's lines for `dropped`, and of its header if asked
+        lines = [{"content": self._note_line(message)} for message in dropped]
+        # Less the 4 tokens each counted message is framed with
+        tokens = sum(count - 4 for count in self.counter.count_each(lines))
+        if header:
+            tokens += self._count_one(self.note([]))
+        return tokens
+
+    def _count_one(self, message: dict) -> int:
+        return self.counter.count_each([message])[0]
+
+
+def common_suffix(a: str, b: str) -> int:
+    """The length of the longest common suffix of two strings."""
+    length = 0
+    for x, y in zip(reversed(a), reversed(b)):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+# The policy of agents that don't have their own
+default_policy = ContextPolicy.from_env()
+
+
+def set_context_policy(policy: ContextPolicy):
+    """Sets the policy of every agent without its own (None sends whole histories)."""
+    global default_policy
+    default_policy = policy
@@ -0,0 +1,205 @@
+import os
+from bisect import bisect_right
+
+from chat.tokens import shared_counter
+
+from . import context
+
+# How chats are rendered into an agent's prompt:
+# - "perspective": the agent's own chats as "You: ..." assistant messages and everyone
+#   else's as "<name>: ...", so every agent in a meeting sees different messages.
+# - "shared": every chat as "<name>: ..." whoever reads it, followed by a final system
+#   message saying which agent is speaking. Agents in a meeting (and later rounds of the
+#   same meeting) then share their prompt's prefix, which providers cache.
+RENDERINGS = ("perspective", "shared")
+RENDERING = os.getenv("HISTORY_RENDERING", "perspective")
+
+
+def set_rendering(rendering: str):
+    """Selects how chat histories are rendered; call it before running any agents."""
+    global RENDERING
+    if rendering not in RENDERINGS:
+        raise ValueError(f"Unknown rendering '{rendering}', expected one of {RENDERINGS}")
+    RENDERING = rendering
+
+
+class ChatHistory:
+    """
+    An agent's chat history, maintained incrementally as chats are published to the
+    meetings the agent has joined.
+
+    The history is built once from the agent's meetings (the same walk the original
+    `Agent.chat_history` did on every call) and from then on each published chat is
+    rendered once and inserted in timestamp order, so reading the history costs
+    O(new messages) instead of re-loading and re-formatting the whole conversation.
+
+    The agent's context policy (or the default one, see `base.context`) is applied each
+    time the messages are read; the full history is kept. The policy's deduplication is
+    kept too, and only extended to the messages that arrived since the last read.
+
+    Attributes:
+        agent (Agent): The agent whose point of view the history is rendered from.
+        built (bool): Whether the history currently reflects the agent's meetings.
+        policy (ContextPolicy): The agent's own context policy, or None for the default.
+    """
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.built = False
+        self._keys = []
+        self._messages = []
+        self._chat_ids = set()
+        # Each meeting's position among the agent's meetings and its chats added so far
+        self._meetings = {}
+        self.policy = None
+        # The deduplication of a prefix of the messages, and the policy it is by
+        self._deduplicated = []
+        self._deduplicated_by = None
+        # The whole history and the messages returned when it was last read
+        self._last_read = ([], [])
+
+    def messages(self) -> list:
+        """Returns the history as [{role, content}] dicts ordered by chat timestamp."""
+        if not self.built:
+            self.build()
+        messages = list(self._messages)
+        history = messages
+        policy = self.current_policy()
+        if policy is not None:
+            if policy.dedup:
+                messages = self.deduplicated(policy)
+            messages = policy.trim(messages)
+        if RENDERING == "shared":
+            # Identity goes last, so that it doesn't break the shared prefix
+            messages.append(
+                {
+                    "role": "system",
+                    "content": f"You are {self.agent.agent_name}; "
+                    f"the messages from {self.agent.agent_name} above are yours.",
+                }
+            )
+        self._last_read = (history, messages)
+        return messages
+
+    def deduplicated(self, policy) -> list:
+        """The history deduplicated by `policy`, extending the last deduplication."""
+        if policy is not self._deduplicated_by:
+            self._deduplicated = []
+            self._deduplicated_by = policy
+        self._deduplicated = policy.deduplicate(self._messages, self._deduplicated)
+        return self._deduplicated
+
+    def current_policy(self):
+        """The agent's context policy, or the default one."""
+        return self.policy if self.policy is not None else context.default_policy
+
+    @property
+    def prompt_tokens(self) -> int:
+        """The tokens of the messages last read, e.g. for a call."""
+        return self._counter().count(self._last_read[1])
+
+    @property
+    def full_tokens(self) -> int:
+        """The tokens of the whole history when it was last read, before any policy."""
+        return self._counter().count(self._last_read[0])
+
+    def _counter(self):
+        policy = self.current_policy()
+        if policy is not None:
+            return policy.counter
+        return shared_counter(context.ENCODING_NAME)
+
+    def build(self):
+        """(Re)builds the history from every meeting the agent is in."""
+        self.reset()
+        self.built = True
+        for meeting in self.agent.meetings:
+            self.add_meeting(meeting)
+
+    def reset(self):
+        """Discards the history; it is rebuilt on the next read."""
+        for meeting in self._meetings:
+            subscribers(meeting).discard(self)
+        self.built = False
+        self._keys.clear()
+        self._messages.clear()
+        self._chat_ids.clear()
+        self._meetings.clear()
+        self._deduplicated = []
+
+    def add_meeting(self, meeting):
+        """Subscribes the history to a meeting and merges in the meeting's chats."""
+        if not self.built or meeting in self._meetings:
+            return
+        # Joined last, so the meeting comes after the agent's others, as in a rebuild
+        self._meetings[meeting] = [len(self._meetings), 0]
+        subscribers(meeting).add(self)
+        for chat in meeting.chats:
+            self.add_chat(chat, meeting)
+
+    def remove_meeting(self, meeting):
+        """Unsubscribes the history from a meeting the agent has left."""
+        if meeting in self._meetings:
+            self.reset()
+        subscribers(meeting).discard(self)
+
+    def add_chat(self, chat, meeting):
+        """Renders a chat newly published to `meeting` and inserts it in timestamp order."""
+        if not self.built or chat.chat_id in self._chat_ids:
+            return
+        self._chat_ids.add(chat.chat_id)
+        # Ties are ordered by meeting, then by their order in the meeting, as the stable
+        # sort of the agent's meetings' chats did; published chats are the meeting's last
+        position = self._meetings[meeting]
+        key = (chat.chat_timestamp, position[0], position[1])
+        position[1] += 1
+        index = bisect_right(self._keys, key)
+        self._keys.insert(index, key)
+        self._messages.insert(index, self.render(chat))
+        # Messages after an insertion may now repeat it
+        del self._deduplicated[index:]
+
+    def render(self, chat) -> dict:
+        """Converts a chat into the format {role: agent, content: chat_content}."""
+        chat_content: str = chat.content if chat.content else ""
+
+        # Shared renderings don't depend on who reads them
+        if chat.agent.agent_id == self.agent.agent_id and RENDERING != "shared":
+            role = "assistant"
+            content = "You: " + chat_content
+        elif chat.agent.agent_name == "system":
+            role = "system"
+            content = "System: " + chat_content
+
+        else:
+            role = "user"
+            content = chat.agent.agent_name + ": " + chat_content
+
+        return {"role": role, "content": content}
+
+
+def subscribers(meeting) -> set:
+    """Returns the chat histories subscribed to a meeting."""
+    histories = getattr(meeting, "_chat_histories", None)
+    if histories is None:
+        histories = meeting._chat_histories = set()
+    return histories
+
+
+def publish(meeting, chat):
+    """Delivers a chat published to a meeting to every subscribed history."""
+    histories = subscribers(meeting)
+    if not histories:
+        return
+    if chat.agent is None:
+        # Not renderable yet; rebuild once the chat is complete
+        invalidate(meeting)
+        return
+    for history in histories:
+        history.add_chat(chat, meeting)
+
+
+def invalidate(meeting):
+    """Resets every history subscribed to a meeting."""
+    for history in list(subscribers(meeting)):
+        history.reset()
@@ -0,0 +1,53 @@
+import asyncio
+
+
+class MeetingMixin:
+    """
+    Behaviour shared by every Meeting implementation, whether it is a SQLAlchemy model
+    (`base.tables.Meeting`) or a plain in-memory object (`base.memory.Meeting`).
+    """
+
+    __slots__ = ()
+
+    async def fan_out(self, agents, response_format, publish=None) -> list:
+        """
+        Runs several agents' `forward` calls concurrently, as if each had been the only
+        one to speak.
+
+        Every agent answers from a snapshot of its chat history taken when `fan_out` is
+        called, so none of them sees another's answer. Once all have answered, the chats
+        returned by `publish(agent, output)` (if given, and not None) are appended to the
+        meeting together, in the order of `agents`, so the resulting history doesn't
+        depend on which call finished first. If any call fails the others are cancelled
+        and nothing is published.
+
+        Args:
+            agents (list): The agents to ask, each a member of the meeting.
+            response_format (dict): The response format passed to every `forward`.
+            publish (callable): Builds the chat to publish for an agent's output.
+
+        Returns:
+            list: The agents' outputs, in the order of `agents`.
+        """
+        # Independent samples, so the gateway doesn't serve agents with identical
+        # histories a single shared response
+        snapshots = [agent.chat_history for agent in agents]
+        calls = [
+            asyncio.ensure_future(
+                agent.forward(response_format, sample=i, messages=messages)
+            )
+            for i, (agent, messages) in enumerate(zip(agents, snapshots))
+        ]
+        try:
+            outputs = await asyncio.gather(*calls)
+        except BaseException:
+            # The first failure propagates as it is, once the other calls are cancelled
+            for call in calls:
+                call.cancel()
+            await asyncio.gather(*calls, return_exceptions=True)
+            raise
+
+        if publish is not None:
+            chats = [publish(agent, output) for agent, output in zip(agents, outputs)]
+            self.chats.extend([chat for chat in chats if chat is not None])
+        return outputs
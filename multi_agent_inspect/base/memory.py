@@ -0,0 +1,204 @@
+"""
+Lightweight in-memory implementations of Agent, Meeting and Chat.
+
+These mirror the attributes and relationships of the SQLAlchemy models in `base.tables`
+(so the example systems run unchanged against them through `Wrapper`) but are plain
+slotted objects without ORM instrumentation, validation or persistence. Relationship
+lists keep their other side in sync on `append`/`extend`/`remove`, like a backref.
+"""
+
+import datetime
+import uuid
+from .agent import AgentMixin, display_name
+from .meeting import MeetingMixin
+from .history import publish, invalidate
+
+
+class Record:
+    """Common helpers of the in-memory objects."""
+
+    __slots__ = ()
+    columns = ()
+
+    def to_dict(self):
+        return {column: getattr(self, column) for column in self.columns}
+
+    def update(self, **kwargs):
+        for attr, value in kwargs.items():
+            setattr(self, attr, value)
+
+
+class MeetingChats(list):
+    """`Meeting.chats`: appending a chat publishes it to the meeting's subscribers."""
+
+    __slots__ = ("meeting",)
+
+    def __init__(self, meeting):
+        super().__init__()
+        self.meeting = meeting
+
+    def append(self, chat):
+        if chat._meeting is not None and chat._meeting is not self.meeting:
+            chat._meeting.chats.remove(chat)
+        super().append(chat)
+        chat._meeting = self.meeting
+        publish(self.meeting, chat)
+
+    def extend(self, chats):
+        for chat in chats:
+            self.append(chat)
+
+    def remove(self, chat):
+        super().remove(chat)
+        chat._meeting = None
+        invalidate(self.meeting)
+
+
+class Membership(list):
+    """`Meeting.agents` / `Agent.meetings`: each side of the many-to-many relationship."""
+
+    __slots__ = ("owner", "backref")
+
+    def __init__(self, owner, backref):
+        super().__init__()
+        self.owner = owner
+        self.backref = backref
+
+    def _pair(self, other):
+        return (self.owner, other) if isinstance(self.owner, Agent) else (other, self.owner)
+
+    def append(self, other):
+        super().append(other)
+        list.append(getattr(other, self.backref), self.owner)
+        agent, meeting = self._pair(other)
+        if agent._chat_history is not None:
+            agent._chat_history.add_meeting(meeting)
+
+    def extend(self, others):
+        for other in others:
+            self.append(other)
+
+    def remove(self, other):
+        super().remove(other)
+        list.remove(getattr(other, self.backref), self.owner)
+        agent, meeting = self._pair(other)
+        if agent._chat_history is not None:
+            agent._chat_history.remove_meeting(meeting)
+
+
+class Chat(Record):
+    __slots__ = ("chat_id", "chat_timestamp", "_agent", "_meeting", "_content")
+    columns = ("chat_id", "agent_id", "meeting_id", "content", "chat_timestamp")
+
+    def __init__(
+        self, agent=None, content=None, meeting=None, chat_id=None, chat_timestamp=None
+    ):
+        self.chat_id = chat_id or str(uuid.uuid4())
+        self.chat_timestamp = chat_timestamp or datetime.datetime.utcnow()
+        self._agent = None
+        self._meeting = None
+        self._content = content
+        self.agent = agent
+        if meeting is not None:
+            meeting.chats.append(self)
+
+    @property
+    def agent(self):
+        return self._agent
+
+    @agent.setter
+    def agent(self, agent):
+        if self._agent is not None:
+            self._agent.chats.remove(self)
+        self._agent = agent
+        if agent is not None:
+            agent.chats.append(self)
+        self._changed()
+
+    @property
+    def meeting(self):
+        return self._meeting
+
+    @meeting.setter
+    def meeting(self, meeting):
+        if meeting is not None:
+            meeting.chats.append(self)
+        elif self._meeting is not None:
+            self._meeting.chats.remove(self)
+
+    @property
+    def content(self):
+        return self._content
+
+    @content.setter
+    def content(self, content):
+        self._content = content
+        self._changed()
+
+    @property
+    def agent_id(self):
+        return self._agent.agent_id if self._agent is not None else None
+
+    @property
+    def meeting_id(self):
+        return self._meeting.meeting_id if self._meeting is not None else None
+
+    def _changed(self):
+        # Cached renderings of an already published chat are stale
+        if self._meeting is not None:
+            invalidate(self._meeting)
+
+
+class Meeting(MeetingMixin, Record):
+    __slots__ = (
+        "meeting_id",
+        "meeting_name",
+        "meeting_timestamp",
+        "chats",
+        "agents",
+        "_chat_histories",
+    )
+    columns = ("meeting_id", "meeting_name", "meeting_timestamp")
+
+    def __init__(self, meeting_name=None, meeting_id=None, meeting_timestamp=None):
+        self.meeting_id = meeting_id or str(uuid.uuid4())
+        self.meeting_name = meeting_name
+        self.meeting_timestamp = meeting_timestamp or datetime.datetime.utcnow()
+        self.chats = MeetingChats(self)
+        self.agents = Membership(self, "meetings")
+        self._chat_histories = None
+
+
+class Agent(AgentMixin, Record):
+    __slots__ = (
+        "agent_id",
+        "agent_name",
+        "agent_backstory",
+        "model",
+        "temperature",
+        "agent_timestamp",
+        "chats",
+        "meetings",
+        "_chat_history",
+    )
+    columns = (
+        "agent_id",
+        "agent_name",
+        "agent_backstory",
+        "model",
+        "temperature",
+        "agent_timestamp",
+    )
+
+    def __init__(
+        self, agent_name, model="gpt-4o-mini", temperature=0.5, agent_backstory=None
+    ):
+        self.agent_id = str(uuid.uuid4())
+        self.agent_name = display_name(agent_name)
+        self.agent_backstory = agent_backstory
+        self.model = model
+        self.temperature = temperature
+        self.agent_timestamp = datetime.datetime.utcnow()
+        self.chats = []
+        self.meetings = Membership(self, "agents")
+        self._chat_history = None
@@ -1,36 +1,190 @@
+import asyncio
+import functools
+import logging
 import os
-from sqlalchemy import create_engine
+import threading
+import weakref
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 
-from .base import Base, Wrapper  # noqa
+from .base import Base, Wrapper, UnitOfWork  # noqa
 
 from .tables import (
     Chat,
     Meeting,
     AgentsbyMeeting,
     Agent,
+    history_loader,
 )  # noqa
 
+# Pool settings used when an engine is first created, overridable per database
+DEFAULT_POOL_SETTINGS = {
+    "pool_size": 16,
+    "max_overflow": 64,
+    "pool_timeout": 30,
+}
 
-def initialize_session(db_name: str):
+# Process-wide registry: db_name -> (engine, session factory, settings)
+_engines = {}
+_engines_lock = threading.Lock()
+
+# Async engines are bound to the event loop that created them:
+# loop -> {db_name: (engine, session factory, schema creation task)}
+_async_engines = weakref.WeakKeyDictionary()
+
+
+def _db_path(db_name: str) -> str:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    os.makedirs(f"{current_dir}/db", exist_ok=True)
+    return f"{current_dir}/db/{db_name}"
+
+
+def get_engine(db_name: str, wal: bool = None, **pool_settings):
     """
-    Returns a new thread-safe session.
+    Returns the engine and session factory for a database, creating them (and the
+    schema) on first use.
+
+    Engines are cached per database name for the lifetime of the process, so the schema
+    is only created once however many samples open a session. Pool settings (pool_size,
+    max_overflow, pool_timeout, pool_recycle, ...) apply when the engine is created;
+    different pool settings asked for once it exists are ignored with a warning. `wal`
+    (journal_mode=WAL with synchronous=NORMAL, off by default) can be turned on at any
+    time: the database is switched over and the pool's connections are replaced by ones
+    set up for it, whoever opened the engine first.
     """
+    requested = dict(pool_settings)
+    if wal is not None:
+        requested["wal"] = wal
 
-    # Create engine and Base
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    engine = create_engine(
-        f"sqlite:///{current_dir}/db/{db_name}",
-        connect_args={"check_same_thread": False},
-    )
+    with _engines_lock:
+        if db_name in _engines:
+            engine, SessionFactory, existing = _engines[db_name]
+            if requested.pop("wal", False) and not existing["wal"]:
+                # synchronous is set per connection, so the pooled connections are
+                # replaced by ones the connect listener sets up for WAL; the first of
+                # them switches the database file over
+                existing["wal"] = True
+                engine.dispose()
+                with engine.connect():
+                    pass
+            ignored = {k: v for k, v in requested.items() if existing.get(k) != v}
+            if ignored:
+                logging.warning(
+                    f"Engine for '{db_name}' already exists with settings {existing}, "
+                    f"ignoring {ignored}. Call dispose_engines() to reconfigure it."
+                )
+            return engine, SessionFactory
+
+        settings = {**DEFAULT_POOL_SETTINGS, "wal": False, **requested}
+        pool_settings = {k: v for k, v in settings.items() if k != "wal"}
+
+        # Create engine and Base
+        engine = create_engine(
+            f"sqlite:///{_db_path(db_name)}",
+            connect_args={"check_same_thread": False},
+            **pool_settings,
+        )
+        # Reads the settings at every connect, so WAL can be turned on later
+        event.listen(engine, "connect", functools.partial(_configure, settings))
+
+        # Create tables
+        Base.metadata.create_all(engine)
+        # print(Base.metadata.tables.keys())
 
-    # Session factory
-    SessionFactory = sessionmaker(bind=engine)
+        assert len(Base.metadata.tables.keys()) > 0
 
-    # Create tables
-    Base.metadata.create_all(engine)
-    # print(Base.metadata.tables.keys())
+        # Session factory. Not a scoped_session: concurrent samples share a thread (the
+        # event loop) but must each get their own session.
+        SessionFactory = sessionmaker(bind=engine)
+
+        _engines[db_name] = (engine, SessionFactory, settings)
+        return engine, SessionFactory
+
+
+def _configure(settings: dict, dbapi_connection, connection_record):
+    if settings["wal"]:
+        _enable_wal(dbapi_connection, connection_record)
+
+
+def _enable_wal(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+def dispose_engines():
+    """Disposes of every cached engine, closing their pooled connections."""
+    with _engines_lock:
+        for engine, _, _ in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+def initialize_session(db_name: str, wal: bool = None, **pool_settings):
+    """
+    Returns a new session bound to the cached engine for the database.
+    """
 
-    assert len(Base.metadata.tables.keys()) > 0
+    _, SessionFactory = get_engine(db_name, wal=wal, **pool_settings)
 
     return SessionFactory(), Base
+
+
+async def get_async_engine(db_name: str, wal: bool = False, **pool_settings):
+    """
+    Returns the aiosqlite engine and `AsyncSession` factory for a database on the running
+    event loop, creating them (and the schema) on first use.
+
+    Sessions from the factory do not expire objects on commit, so attributes never need
+    an implicit (and, on an `AsyncSession`, impossible) refresh.
+    """
+    engines = _async_engines.setdefault(asyncio.get_running_loop(), {})
+    if db_name not in engines:
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{_db_path(db_name)}",
+            **{**DEFAULT_POOL_SETTINGS, **pool_settings},
+        )
+        if wal:
+            event.listen(engine.sync_engine, "connect", _enable_wal)
+
+        async def create_schema():
+            async with engine.begin() as connection:
+                await connection.run_sync(Base.metadata.create_all)
+
+        SessionFactory = async_sessionmaker(engine, expire_on_commit=False)
+        engines[db_name] = (engine, SessionFactory, asyncio.ensure_future(create_schema()))
+
+    engine, SessionFactory, schema = engines[db_name]
+    # Concurrent first callers all wait for the one schema creation
+    await asyncio.shield(schema)
+    return engine, SessionFactory
+
+
+async def dispose_async_engines():
+    """Disposes of every async engine created on the running event loop."""
+    engines = _async_engines.pop(asyncio.get_running_loop(), {})
+    for engine, _, _ in engines.values():
+        await engine.dispose()
+
+
+async def initialize_async_session(db_name: str, **pool_settings):
+    """
+    Returns a new `AsyncSession` bound to the cached async engine for the database.
+    """
+
+    _, SessionFactory = await get_async_engine(db_name, **pool_settings)
+
+    return SessionFactory(), Base
+
+
+async def load_agents(session, *criteria) -> list:
+    """
+    Loads agents (filtered by `criteria`) together with their meetings and chats, so that
+    `Agent.chat_history` can be read without any further I/O.
+    """
+    result = await session.execute(
+        select(Agent).where(*criteria).options(history_loader())
+    )
+    return list(result.unique().scalars())
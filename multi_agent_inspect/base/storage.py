@@ -0,0 +1,172 @@
+"""
+Storage backends selectable per evaluation (see `open_storage`).
+
+- "orm": SQLAlchemy models persisted through a session, optionally batched in a
+  `UnitOfWork` and/or handed to the write-behind writer.
+- "memory": plain in-memory objects (`base.memory`); nothing is persisted.
+- "hybrid": plain in-memory objects during the sample, handed to the write-behind writer
+  when the sample ends.
+- "async": SQLAlchemy models in an `AsyncSession` on aiosqlite, batched in an
+  `AsyncUnitOfWork`; must be opened with `async with`.
+"""
+
+from . import memory, tables
+from .base import Storage, UnitOfWork, AsyncUnitOfWork
+from .session import initialize_session, initialize_async_session
+from .writer import get_writer
+
+MEMORY_CLASSES = {
+    tables.Agent: memory.Agent,
+    tables.Meeting: memory.Meeting,
+    tables.Chat: memory.Chat,
+}
+
+MEMORY_TABLES = {
+    memory.Agent: tables.Agent.__table__,
+    memory.Meeting: tables.Meeting.__table__,
+    memory.Chat: tables.Chat.__table__,
+}
+
+
+class ORMStorage(Storage):
+    """
+    Agents, meetings and chats are SQLAlchemy models added to `session`. If a unit of
+    work is given it is active while the storage is open; the session is closed with it.
+    """
+
+    def __init__(self, session, unit_of_work: UnitOfWork = None):
+        self.session = session
+        self.unit_of_work = unit_of_work
+
+    def create(self, cls, *args, **kwargs):
+        kwargs["session"] = self.session
+        return cls(*args, **kwargs)
+
+    def __enter__(self):
+        if self.unit_of_work is not None:
+            self.unit_of_work.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if self.unit_of_work is not None:
+                self.unit_of_work.__exit__(exc_type, exc_value, traceback)
+        finally:
+            self.close()
+        return False
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncORMStorage(ORMStorage):
+    """
+    Agents, meetings and chats are SQLAlchemy models added to an `AsyncSession`, whose
+    commits are batched in an `AsyncUnitOfWork` and overlap with the agents' LLM calls.
+    The session is opened by `async with` and closed with it.
+    """
+
+    def __init__(self, db_name: str, **unit_of_work_settings):
+        super().__init__(None)
+        self.db_name = db_name
+        self.unit_of_work_settings = unit_of_work_settings
+
+    def create(self, cls, *args, **kwargs):
+        kwargs["session"] = self.session.sync_session
+        return cls(*args, **kwargs)
+
+    def __enter__(self):
+        raise TypeError("AsyncORMStorage must be used with 'async with'.")
+
+    async def __aenter__(self):
+        self.session, _ = await initialize_async_session(self.db_name)
+        self.unit_of_work = AsyncUnitOfWork(self.session, **self.unit_of_work_settings)
+        await self.unit_of_work.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        try:
+            await self.unit_of_work.__aexit__(exc_type, exc_value, traceback)
+        finally:
+            await self.session.close()
+        return False
+
+
+class MemoryStorage(Storage):
+    """Agents, meetings and chats are plain slotted objects that are never persisted."""
+
+    def create(self, cls, *args, **kwargs):
+        kwargs.pop("session", None)
+        return MEMORY_CLASSES.get(cls, cls)(*args, **kwargs)
+
+
+class HybridStorage(MemoryStorage):
+    """
+    Plain in-memory objects while the sample runs; their rows are handed to the
+    write-behind writer when the storage is closed, off the event loop.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.objects = []
+
+    def create(self, cls, *args, **kwargs):
+        obj = super().create(cls, *args, **kwargs)
+        self.objects.append(obj)
+        return obj
+
+    def close(self):
+        self.writer.submit_rows(rows(self.objects))
+        self.objects = []
+
+
+def rows(objs) -> dict:
+    """Converts in-memory objects into rows of the corresponding tables."""
+    table_rows = {}
+    for obj in objs:
+        table_rows.setdefault(MEMORY_TABLES[type(obj)], []).append(obj.to_dict())
+        if isinstance(obj, memory.Meeting):
+            table_rows.setdefault(tables.AgentsbyMeeting.__table__, []).extend(
+                {"agent_id": agent.agent_id, "meeting_id": obj.meeting_id}
+                for agent in obj.agents
+            )
+    return table_rows
+
+
+def open_storage(
+    kind: str = "orm",
+    db_name: str = "test.db",
+    batch_writes: bool = True,
+    write_behind: bool = False,
+) -> Storage:
+    """
+    Opens the storage for one sample.
+
+    Args:
+        kind (str): "orm", "memory", "hybrid" or "async".
+        db_name (str): The database to persist to.
+        batch_writes (bool): ("orm") Batch the session's commits in a `UnitOfWork`.
+        write_behind (bool): ("orm") Hand the batches to the database's write-behind
+                             writer instead of committing the session.
+    """
+    if kind == "memory":
+        return MemoryStorage()
+    if kind == "hybrid":
+        return HybridStorage(get_writer(db_name))
+    if kind == "async":
+        return AsyncORMStorage(db_name)
+    if kind != "orm":
+        raise ValueError(
+            f"Unknown storage '{kind}'. Expected 'orm', 'memory', 'hybrid' or 'async'."
+        )
+
+    session, _ = initialize_session(db_name, wal=True if write_behind else None)
+    if write_behind:
+        # Writes are snapshotted in batches and persisted by the writer thread
+        unit_of_work = UnitOfWork(session, writer=get_writer(db_name))
+    elif batch_writes:
+        # Writes are committed in batches and flushed at sample end
+        unit_of_work = UnitOfWork(session)
+    else:
+        unit_of_work = None
+    return ORMStorage(session, unit_of_work)
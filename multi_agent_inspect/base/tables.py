@@ -1,12 +1,13 @@
 from sqlalchemy import Column, String, DateTime, ForeignKey, Float, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import event
+from sqlalchemy.orm import relationship, selectinload, joinedload
 import datetime
 import uuid
-import random
-import string
 from sqlalchemy.orm import object_session
-from .base import CustomBase, CustomColumn, AutoSaveList
-from chat import get_structured_json_response_from_gpt
+from .base import CustomBase, CustomColumn, AutoSaveList, UnitOfWork
+from .agent import AgentMixin, display_name
+from .meeting import MeetingMixin
+from .history import publish, invalidate
 import asyncio
 from functools import wraps
 import threading
@@ -41,7 +42,7 @@ class Chat(CustomBase):
     )
 
 
-class Meeting(CustomBase):
+class Meeting(MeetingMixin, CustomBase):
     __tablename__ = "meeting"
 
     meeting_id = CustomColumn(
@@ -92,7 +93,7 @@ class AgentsbyMeeting(CustomBase):
     )
 
 
-class Agent(CustomBase):
+class Agent(AgentMixin, CustomBase):
     __tablename__ = "agent"
 
     agent_id = CustomColumn(
@@ -130,55 +131,62 @@ class Agent(CustomBase):
         super().__init__(
             session, agent_name=agent_name, model=model, temperature=temperature
         )
-        characters = (
-            string.ascii_letters + string.digits
-        )  # includes both upper/lower case letters and numbers
-        random_id = "".join(random.choices(characters, k=4))
-        self.agent_name = agent_name + " " + random_id
+        self.agent_name = display_name(agent_name)
 
-    def __repr__(self):
-        return f"{self.agent_name} {self.agent_id}"
+    def checkpoint(self):
+        # Forward boundary: commit any batched writes that are due
+        unit_of_work = UnitOfWork.of(object_session(self))
+        if unit_of_work is not None:
+            return unit_of_work.checkpoint()
+        return None
 
-    @property
-    def chat_history(self):
-        meetings = self.meetings
-        chats = []
-        for meeting in meetings:
-            chats.extend(meeting.chats)
 
-        # order chats by timestamp
-        chats = sorted(chats, key=lambda x: x.chat_timestamp)
+def history_loader():
+    """
+    Loader options that eagerly load everything `Agent.chat_history` reads, for queries
+    on an `AsyncSession` (which cannot lazy load) or to avoid N+1 lazy loads.
+    """
+    return selectinload(Agent.meetings).selectinload(Meeting.chats).joinedload(Chat.agent)
 
-        # Convert into the format [{role: agent, content: chat_content}]
-        def to_chat(chat):
-            chat_content: str = chat.content if chat.content else ""
 
-            if chat.agent.agent_id == self.agent_id:
-                role = "assistant"
-                content = "You: " + chat_content
-            elif chat.agent.agent_name == "system":
-                role = "system"
-                content = "System: " + chat_content
+# Keep every subscribed agent's chat history up to date as chats are published
+@event.listens_for(Meeting.chats, "append")
+def _on_chat_published(meeting, chat, initiator):
+    publish(meeting, chat)
 
-            else:
-                role = "user"
-                content = chat.agent.agent_name + ": " + chat_content
 
-            return {"role": role, "content": content}
+@event.listens_for(Meeting.chats, "remove")
+def _on_chat_removed(meeting, chat, initiator):
+    invalidate(meeting)
 
-        chats = [to_chat(chat) for chat in chats]
-        return chats
 
-    async def forward(self, response_format) -> dict:
+@event.listens_for(Meeting.agents, "append")
+def _on_agent_joined(meeting, agent, initiator):
+    history = getattr(agent, "_chat_history", None)
+    if history is not None:
+        history.add_meeting(meeting)
 
-        # logging.info(f"Agent {self.agent_name} is thinking...")
 
-        messages = self.chat_history
+@event.listens_for(Agent.meetings, "append")
+def _on_meeting_joined(agent, meeting, initiator):
+    _on_agent_joined(meeting, agent, initiator)
 
-        response_json = await get_structured_json_response_from_gpt(
-            messages=messages, response_format=response_format, temperature=0.5
-        )
 
-        # logging.info(f"Agent {self.agent_name} has responded with: \n{response_json}\n -------------------")
+@event.listens_for(Meeting.agents, "remove")
+def _on_agent_left(meeting, agent, initiator):
+    history = getattr(agent, "_chat_history", None)
+    if history is not None:
+        history.remove_meeting(meeting)
+
+
+@event.listens_for(Agent.meetings, "remove")
+def _on_meeting_left(agent, meeting, initiator):
+    _on_agent_left(meeting, agent, initiator)
+
 
-        return response_json
+@event.listens_for(Chat.content, "set")
+@event.listens_for(Chat.agent, "set")
+def _on_chat_changed(chat, value, oldvalue, initiator):
+    # Cached renderings of an already published chat are stale
+    if chat.meeting is not None:
+        invalidate(chat.meeting)
@@ -0,0 +1,39 @@
+import datetime
+import random
+
+import pytest
+
+from base import Agent, Chat, Meeting, Wrapper, open_storage
+
+START = datetime.datetime(2024, 1, 1)
+
+
+@pytest.mark.parametrize("kind", ["memory", "orm"])
+def test_incremental_history_matches_a_rebuild_with_tied_timestamps(kind):
+    for trial in range(20):
+        rng = random.Random(trial)
+        storage = open_storage(kind, db_name="test_history.db")
+        with storage:
+            agents = [
+                Wrapper(Agent, storage)(agent_name=f"Agent {i}") for i in range(3)
+            ]
+            meetings = [
+                Wrapper(Meeting, storage)(meeting_name=f"Meeting {i}") for i in range(2)
+            ]
+            for meeting in meetings:
+                meeting.agents.extend(agents)
+
+            for turn in range(20):
+                # Second-resolution timestamps, so chats often tie
+                timestamp = START + datetime.timedelta(seconds=rng.randint(0, 5))
+                rng.choice(meetings).chats.append(
+                    Wrapper(Chat, storage)(
+                        agent=rng.choice(agents),
+                        content=f"Chat {turn}",
+                        chat_timestamp=timestamp,
+                    )
+                )
+                for agent in agents:
+                    incremental = agent.chat_history
+                    agent._chat_history.reset()
+                    assert agent.chat_history == incremental
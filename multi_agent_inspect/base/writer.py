@@ -0,0 +1,187 @@
+import atexit
+import logging
+import queue
+import threading
+from sqlalchemy import inspect
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import MANYTOONE
+from chat.tracing import span
+
+from .base import Base
+from .session import get_engine
+
+
+class WriteBehindWriter:
+    """
+    A single background thread that writes row snapshots to the database in batched
+    transactions.
+
+    Producers (the units of work of concurrently running samples) only ever enqueue
+    snapshots, so database writes never block the event loop driving `Agent.forward`,
+    and all writes to the SQLite file are serialized through one connection instead of
+    contending for its lock. Rows are upserted, so an object snapshotted several times
+    ends up with its latest state.
+
+    Attributes:
+        engine (Engine): The engine the writer connects through.
+        max_batch (int): The maximum number of snapshots written per transaction.
+        written (int): The number of rows written so far.
+        failed (int): The number of snapshots that could not be written.
+    """
+
+    def __init__(self, engine, max_batch: int = 512):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.written = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="write-behind-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, *objs):
+        """Snapshots objects and enqueues their rows without waiting for them to be written."""
+        if objs:
+            self._queue.put(snapshot(*objs))
+
+    def submit_rows(self, rows: dict):
+        """Enqueues prebuilt rows ({table: [row, ...]}) without waiting for them."""
+        if rows:
+            self._queue.put(rows)
+
+    def flush(self):
+        """Blocks until every snapshot submitted so far has been written."""
+        self._queue.join()
+
+    def close(self):
+        """Writes any remaining snapshots and stops the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            snapshots = [rows for rows in batch if rows is not None]
+            try:
+                self._write(snapshots)
+            except Exception as e:
+                logging.error(f"Write-behind writer failed on {len(snapshots)} snapshots: {e}")
+                self.failed += len(snapshots)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if len(snapshots) < len(batch):
+                return
+
+    def _write(self, batch: list):
+        merged = merge(batch)
+        rows_merged = sum(len(rows) for rows in merged.values())
+        with span("write", "db", rows=rows_merged), self.engine.begin() as connection:
+            self.written += upsert(connection, merged)
+
+
+def merge(snapshots: list) -> dict:
+    """Merges row snapshots, keeping the latest row per primary key."""
+    merged = {}
+    for rows in snapshots:
+        for table, table_rows in rows.items():
+            keyed = merged.setdefault(table, {})
+            for row in table_rows:
+                keyed[tuple(row[c.name] for c in table.primary_key)] = row
+    return merged
+
+
+def upsert(connection, merged: dict) -> int:
+    """Upserts merged rows (see `merge`) on a connection, returning the number written."""
+    written = 0
+    # Parents before children so foreign keys resolve
+    for table in Base.metadata.sorted_tables:
+        if not merged.get(table):
+            continue
+        rows = list(merged[table].values())
+        statement = insert(table)
+        keys = [c.name for c in table.primary_key]
+        # Association rows only carry their keys; existing rows are left alone
+        updates = {
+            name: statement.excluded[name]
+            for name in rows[0]
+            if name not in keys
+        }
+        if updates:
+            statement = statement.on_conflict_do_update(
+                index_elements=keys, set_=updates
+            )
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=keys)
+        connection.execute(statement, rows)
+        written += len(rows)
+    return written
+
+
+def snapshot(*objs) -> dict:
+    """
+    Captures the rows of mapped objects that have not been flushed by a session.
+
+    Foreign keys are read from the related objects (nothing has synchronized them yet)
+    and many-to-many relationships produce rows of their association table.
+    """
+    rows = {}
+    for obj in objs:
+        mapper = inspect(obj).mapper
+        row = {
+            c.name: getattr(obj, mapper.get_property_by_column(c).key)
+            for c in mapper.local_table.columns
+        }
+
+        for relationship in mapper.relationships:
+            if relationship.direction is MANYTOONE:
+                target = getattr(obj, relationship.key)
+                if target is not None:
+                    for local, remote in relationship.local_remote_pairs:
+                        row[local.name] = getattr(target, remote.key)
+            elif relationship.secondary is not None:
+                for target in getattr(obj, relationship.key):
+                    association = {}
+                    for local, remote in relationship.synchronize_pairs:
+                        association[remote.name] = getattr(obj, local.key)
+                    for local, remote in relationship.secondary_synchronize_pairs:
+                        association[remote.name] = getattr(target, local.key)
+                    rows.setdefault(relationship.secondary, []).append(association)
+
+        rows.setdefault(mapper.local_table, []).append(row)
+    return rows
+
+
+# Process-wide registry: db_name -> writer
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(db_name: str, **pool_settings) -> WriteBehindWriter:
+    """
+    Returns the single write-behind writer for a database, starting it on first use.
+
+    The database's engine is created in WAL mode (with synchronous=NORMAL), so readers
+    are not blocked by the writer.
+    """
+    with _writers_lock:
+        if db_name not in _writers:
+            engine, _ = get_engine(db_name, wal=True, **pool_settings)
+            _writers[db_name] = WriteBehindWriter(engine)
+        return _writers[db_name]
+
+
+@atexit.register
+def close_writers():
+    """Writes any pending snapshots and stops every writer."""
+    with _writers_lock:
+        for writer in _writers.values():
+            writer.close()
+        _writers.clear()
@@ -0,0 +1 @@
+"""Benchmarks for the scaffold's own overhead. Run with `python -m benchmarks.<name>`."""
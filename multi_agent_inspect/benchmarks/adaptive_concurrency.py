@@ -0,0 +1,82 @@
+"""
+Benchmark: a fixed versus an adaptive (AIMD) concurrency limit against a saturated model.
+
+Sends a burst of independent calls through the in-process gateway to the mock model,
+which serves a limited number of calls at once and rejects the rest with a 429 error, as
+a provider does when its capacity is exceeded. Reports the makespan, the 429s received,
+the retries and failed calls, and the concurrency limit each lane ended with.
+
+    python -m benchmarks.adaptive_concurrency --calls 1000 --capacity 40
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+# Set before the gateway is imported
+os.environ.setdefault("GATEWAY_BACKEND", "mock")
+
+from chat import GatewayError, api, get_structured_json_response_from_gpt
+from chat.mock import MockOpenAI
+
+RESPONSE_FORMAT = {"answer": "A single letter, A, B, C or D."}
+
+
+async def run(adaptive: bool, calls: int, max_attempts: int, mock: MockOpenAI):
+    # A fresh lane per run, with the concurrency control under test
+    api.ADAPTIVE_CONCURRENCY = adaptive
+    api.lanes.clear()
+    api.ensure_started()
+    api.client = mock
+    api.retried_calls = api.failed_requests = 0
+
+    async def call(index: int):
+        try:
+            await get_structured_json_response_from_gpt(
+                [{"role": "user", "content": f"Question {index}"}],
+                RESPONSE_FORMAT,
+                cache=False,
+                max_attempts=max_attempts,
+            )
+        except GatewayError:
+            pass
+
+    start = time.perf_counter()
+    await asyncio.gather(*[call(i) for i in range(calls)])
+    makespan = time.perf_counter() - start
+    return makespan, next(iter(api.lanes.values())).concurrency.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--capacity", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--max-attempts", type=int, default=10)
+    args = parser.parse_args()
+
+    api.MAX_CONCURRENT_CALLS = args.concurrency
+    api.MAX_REQUESTS_PER_MINUTE = 10**9
+    api.MAX_TOKENS_PER_MINUTE = 10**12
+
+    print(
+        f"{args.calls} calls of ~{args.latency * 1000:.0f} ms, "
+        f"at most {args.concurrency} in flight, model serves {args.capacity} at once"
+    )
+    for adaptive in (False, True):
+        mock = MockOpenAI(latency=args.latency, capacity=args.capacity)
+        makespan, stats = asyncio.run(
+            run(adaptive, args.calls, args.max_attempts, mock)
+        )
+        print(
+            f"  {'adaptive' if adaptive else 'fixed':>8}: {makespan:.2f}s, "
+            f"{mock.rejected} 429s, {api.retried_calls} retries, "
+            f"{api.failed_requests} failed, final limit {stats['concurrency_limit']} "
+            f"({stats['decisions']['decrease']} decreases)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark: incremental vs. rebuilt `Agent.chat_history` on a debate.
+
+Replays the message pattern of `DebateAgentSystem` (a system agent, the debate agents and
+a final decision agent in one meeting) without calling an LLM, and measures the time and
+SQL statements spent building each agent's history before its `forward` call.
+
+    python -m benchmarks.chat_history --rounds 2 --debaters 3
+"""
+
+import argparse
+import time
+import warnings
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from base import Agent, Meeting, Chat, Base, Wrapper
+
+warnings.filterwarnings("ignore")
+
+
+def run_debate(rounds: int, debaters: int, rebuild: bool, repeats: int):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    statements = 0
+    reading = False
+
+    def count(*args):
+        nonlocal statements
+        statements += reading
+
+    session = sessionmaker(bind=engine)()
+    Agent_, Meeting_, Chat_ = (Wrapper(cls, session) for cls in (Agent, Meeting, Chat))
+
+    system = Agent_(agent_name="system")
+    debate_agents = [Agent_(agent_name=f"Expert {i}") for i in range(debaters)]
+    final_decision_agent = Agent_(agent_name="Final Decision Agent")
+    meeting = Meeting_(meeting_name="debate")
+    meeting.agents.extend(debate_agents + [system, final_decision_agent])
+
+    event.listen(engine, "before_cursor_execute", count)
+    elapsed = 0.0
+    reads = 0
+
+    def read_history(agent):
+        nonlocal elapsed, reads, reading
+        reading = True
+        start = time.perf_counter()
+        for _ in range(repeats):
+            if rebuild:
+                # The original implementation walked every meeting on every call
+                agent.history.reset()
+            agent.chat_history
+        elapsed += time.perf_counter() - start
+        reading = False
+        reads += 1
+
+    for r in range(rounds):
+        for agent in debate_agents:
+            meeting.chats.append(Chat_(agent=system, content="Please solve the task."))
+            read_history(agent)
+            meeting.chats.append(Chat_(agent=agent, content="Thinking... " * 50))
+
+    meeting.chats.append(Chat_(agent=system, content="Provide a final answer."))
+    read_history(final_decision_agent)
+
+    session.close()
+    return elapsed / repeats, statements / repeats, reads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--debaters", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        f"{args.rounds}-round debate, {args.debaters + 2} agents "
+        f"({args.debaters} debaters, system, final decision)"
+    )
+    for name, rebuild in [("rebuild", True), ("incremental", False)]:
+        elapsed, statements, reads = run_debate(
+            args.rounds, args.debaters, rebuild, args.repeats
+        )
+        print(
+            f"{name:>12}: {elapsed * 1000:8.3f} ms in chat_history over {reads} forwards, "
+            f"{statements:.0f} SQL statements"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark: prompt sizes under context policies.
+
+Runs the iterative example systems (whose histories grow with every turn) through the
+in-process gateway against the mock model, with critics always asking for another
+attempt, and reports the prompt tokens per call under each context policy.
+
+    python -m benchmarks.context_policies --samples 20 --completion-tokens 300
+"""
+
+import argparse
+import asyncio
+import os
+
+# The mock model reports prompt tokens; set before the gateway is imported
+os.environ.setdefault("GATEWAY_BACKEND", "mock")
+
+from base import ContextPolicy, MemoryStorage, set_context_policy
+from chat import api, request_tags
+from chat.mock import MockOpenAI
+from examples import QDAgentSystem, ReflexionAgentSystem
+
+SYSTEMS = [QDAgentSystem, ReflexionAgentSystem]
+
+POLICIES = {
+    "none": None,
+    "dedup": ContextPolicy(dedup=True),
+    "window 6 + dedup": ContextPolicy(window=6, dedup=True),
+    "budget 1500 + dedup": ContextPolicy(max_tokens=1500, dedup=True),
+    "budget 1500 + dedup + compact": ContextPolicy(
+        max_tokens=1500, dedup=True, compact=True
+    ),
+}
+
+# A question about as long as a long MMLU question
+TASK = (
+    "A researcher measures the rate of an enzyme-catalysed reaction at increasing "
+    "substrate concentrations, in the presence and absence of a compound that binds "
+    "reversibly to the enzyme's active site. " * 3
+    + "Which of the following best describes the effect of the compound? "
+    "A: Vmax decreases, Km is unchanged B: Vmax is unchanged, Km increases "
+    "C: both decrease D: both increase"
+)
+
+
+class HarshCritic(MockOpenAI):
+    """The mock model, but critics never accept an answer so every turn is run."""
+
+    async def create(self, *args, **kwargs):
+        response = await super().create(*args, **kwargs)
+        call = response.choices[0].message.function_call
+        if call is not None and '"correct"' in call.arguments:
+            call.arguments = call.arguments.replace('"CORRECT"', '"INCORRECT"')
+        return response
+
+
+async def run(system, samples: int, mock: MockOpenAI):
+    api.ensure_started()
+    api.client = mock
+    api.prompt_tokens = 0
+
+    async def run_sample(index: int):
+        with request_tags(task=system.__name__, sample=f"{system.__name__}/{index}"):
+            await system(MemoryStorage()).forward(TASK)
+
+    await asyncio.gather(*[run_sample(i) for i in range(samples)])
+    return api.prompt_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--completion-tokens", type=int, default=300)
+    args = parser.parse_args()
+
+    api.CACHE_ENABLED = False
+    api.MAX_REQUESTS_PER_MINUTE = 10**9
+    api.MAX_TOKENS_PER_MINUTE = 10**12
+
+    for system in SYSTEMS:
+        print(f"\n{system.__name__}:")
+        for name, policy in POLICIES.items():
+            set_context_policy(policy)
+            mock = HarshCritic(latency=0.01, completion_tokens=args.completion_tokens)
+            prompt = asyncio.run(run(system, args.samples, mock))
+            print(
+                f"  {name:>30}: {prompt / mock.calls:7.0f} prompt tokens per call "
+                f"({mock.calls} calls)"
+            )
+
+
+if __name__ == "__main__":
+    main()
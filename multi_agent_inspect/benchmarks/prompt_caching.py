@@ -0,0 +1,87 @@
+"""
+Benchmark: prompt-cache hits with perspective and shared history rendering.
+
+Runs multi-agent systems through the in-process gateway against the mock model, which
+reports the prompt tokens a provider would serve from its prompt cache (the longest
+prefix of a prompt it has already processed, from 1024 tokens). Reports the share of
+prompt tokens cached under each rendering of the agents' chat histories, with the
+gateway limited to a few concurrent calls as under load.
+
+    python -m benchmarks.prompt_caching --samples 20 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import os
+
+# The mock model reports the cached prompt tokens; set before the gateway is imported
+os.environ.setdefault("GATEWAY_BACKEND", "mock")
+
+from base import MemoryStorage, set_rendering
+from base.history import RENDERINGS
+from chat import api, request_tags
+from chat.mock import MockOpenAI
+from examples import (
+    DebateAgentSystem,
+    DynamicRolesAgentSystem,
+    ReflexionAgentSystem,
+    SelfConsistencyAgentSystem,
+)
+
+SYSTEMS = [
+    DebateAgentSystem,
+    DynamicRolesAgentSystem,
+    ReflexionAgentSystem,
+    SelfConsistencyAgentSystem,
+]
+
+
+async def run(system, samples: int, mock: MockOpenAI):
+    api.ensure_started()
+    api.client = mock
+    api.prompt_tokens = api.cached_prompt_tokens = 0
+
+    async def run_sample(index: int):
+        with request_tags(task=system.__name__, sample=f"{system.__name__}/{index}"):
+            await system(MemoryStorage()).forward(
+                f"Question {index}: what is 2 + {index}? A: {index} B: {index + 2} "
+                f"C: {index + 3} D: {index + 4}"
+            )
+
+    await asyncio.gather(*[run_sample(i) for i in range(samples)])
+    return api.prompt_tokens, api.cached_prompt_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--completion-tokens", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    api.MAX_CONCURRENT_CALLS = args.concurrency
+    api.CACHE_ENABLED = False
+    api.MAX_REQUESTS_PER_MINUTE = 10**9
+    api.MAX_TOKENS_PER_MINUTE = 10**12
+
+    print(
+        f"{args.samples} samples per system, "
+        f"~{args.completion_tokens} completion tokens per call"
+    )
+    for system in SYSTEMS:
+        print(f"\n{system.__name__}:")
+        for rendering in RENDERINGS:
+            set_rendering(rendering)
+            mock = MockOpenAI(
+                latency=args.latency, completion_tokens=args.completion_tokens
+            )
+            prompt, cached = asyncio.run(run(system, args.samples, mock))
+            print(
+                f"  {rendering:>11}: {cached} of {prompt} prompt tokens cached "
+                f"({cached / max(prompt, 1):.0%}), {mock.calls} calls"
+            )
+
+
+if __name__ == "__main__":
+    main()
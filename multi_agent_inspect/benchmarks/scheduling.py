@@ -0,0 +1,112 @@
+"""
+Benchmark: gateway scheduling policies on a mixed evaluation.
+
+Runs every example system on the same number of samples at once (as `evaluate_multiple`
+does) through the in-process gateway, with the model call replaced by a simulated latency
+and the gateway limited to a few concurrent calls so requests queue. Reports the makespan,
+the p50/p99 sample latency and the mean sample latency per system for each policy.
+
+    python -m benchmarks.scheduling --samples 20 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from base import MemoryStorage
+from chat import api, request_tags
+from chat.scheduler import POLICIES
+from examples import (
+    COTAgentSystem,
+    DebateAgentSystem,
+    DynamicRolesAgentSystem,
+    QDAgentSystem,
+    ReflexionAgentSystem,
+    SelfConsistencyAgentSystem,
+    StepBackAgentSystem,
+)
+
+SYSTEMS = [
+    COTAgentSystem,
+    DebateAgentSystem,
+    DynamicRolesAgentSystem,
+    QDAgentSystem,
+    ReflexionAgentSystem,
+    SelfConsistencyAgentSystem,
+    StepBackAgentSystem,
+]
+
+
+def simulated_model(latency: float, rng: random.Random):
+    async def call_openai(messages, response_format, model, temperature, insist=False):
+        await asyncio.sleep(rng.expovariate(1 / latency))
+        response = {key: f"{key} text" for key in response_format}
+        if "answer" in response:
+            response["answer"] = rng.choice("ABCD")
+        if "choice" in response:
+            response["choice"] = "general"
+        return response, 100
+
+    return call_openai
+
+
+async def run_sample(system, index: int) -> float:
+    start = time.perf_counter()
+    name = system.__name__
+    with request_tags(task=name, sample=f"{name}/{index}"):
+        await system(MemoryStorage()).forward("What is 2 + 2? A: 3 B: 4 C: 5 D: 22")
+    return time.perf_counter() - start
+
+
+async def run(policy: str, samples: int, seed: int):
+    # A fresh lane per run, with the policy under test
+    api.SCHEDULING_POLICY = policy
+    api.lanes.clear()
+    random.seed(seed)
+    start = time.perf_counter()
+    jobs = [(system, i) for i in range(samples) for system in SYSTEMS]
+    latencies = await asyncio.gather(*[run_sample(system, i) for system, i in jobs])
+    makespan = time.perf_counter() - start
+
+    by_system = {}
+    for (system, _), latency in zip(jobs, latencies):
+        by_system.setdefault(system.__name__, []).append(latency)
+    return makespan, sorted(latencies), by_system
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--policies", nargs="+", default=list(POLICIES))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Only the gateway's queue should hold requests back
+    api.MAX_CONCURRENT_CALLS = args.concurrency
+    api.CACHE_ENABLED = False
+    api.MAX_REQUESTS_PER_MINUTE = 10**9
+    api.MAX_TOKENS_PER_MINUTE = 10**12
+
+    print(
+        f"{len(SYSTEMS)} systems x {args.samples} samples, "
+        f"{args.concurrency} concurrent calls of ~{args.latency * 1000:.0f} ms"
+    )
+    for policy in args.policies:
+        api.call_openai = simulated_model(args.latency, random.Random(args.seed))
+        makespan, latencies, by_system = asyncio.run(run(policy, args.samples, args.seed))
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(
+            f"\n{policy}: makespan {makespan:.2f} s, "
+            f"sample latency p50 {p50:.2f} s, p99 {p99:.2f} s"
+        )
+        for name, system_latencies in by_system.items():
+            print(f"  {name:>28}: mean {statistics.mean(system_latencies):.2f} s")
+
+
+if __name__ == "__main__":
+    main()
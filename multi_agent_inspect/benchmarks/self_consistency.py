@@ -0,0 +1,100 @@
+"""
+Benchmark: adaptive self-consistency against fixed-N majority voting.
+
+Runs the self-consistency system on simulated questions whose answers the model gets
+right with probability `--accuracy` (and otherwise picks another option at random),
+through the in-process gateway. Reports accuracy, model calls per sample and sample
+latency for fixed voting over N answers and for adaptive voting with a budget of N.
+
+    python -m benchmarks.self_consistency --samples 200 --budgets 3 8 16
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import Counter
+
+from base import MemoryStorage
+from chat import api, request_tags
+from examples import SelfConsistencyAgentSystem
+
+CORRECT = "B"
+
+
+def simulated_model(accuracy: float, latency: float, rng: random.Random, calls: Counter):
+    async def call_openai(messages, response_format, model, temperature, insist=False):
+        calls["started"] += 1
+        await asyncio.sleep(rng.expovariate(1 / latency))
+        calls["completed"] += 1
+        if rng.random() < accuracy:
+            answer = CORRECT
+        else:
+            answer = rng.choice([option for option in "ABCD" if option != CORRECT])
+        return {"thinking": "thinking text", "answer": answer}, 100
+
+    return call_openai
+
+
+async def run_sample(system, index: int):
+    start = time.perf_counter()
+    with request_tags(task=system.__name__, sample=f"{system.__name__}/{index}"):
+        answer = await system(MemoryStorage()).forward("What is 2 + 2? A: 3 B: 4 C: 5 D: 22")
+    return answer == CORRECT, time.perf_counter() - start
+
+
+async def run(system, samples: int):
+    return await asyncio.gather(*[run_sample(system, i) for i in range(samples)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[3, 8, 16])
+    parser.add_argument("--accuracy", type=float, default=0.5)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    api.CACHE_ENABLED = False
+    api.MAX_REQUESTS_PER_MINUTE = 10**9
+    api.MAX_TOKENS_PER_MINUTE = 10**12
+
+    print(
+        f"{args.samples} samples, model accuracy {args.accuracy:.0%}, "
+        f"~{args.latency * 1000:.0f} ms per call"
+    )
+    for budget in args.budgets:
+        for adaptive in (False, True):
+            system = type(
+                SelfConsistencyAgentSystem.__name__,
+                (SelfConsistencyAgentSystem,),
+                {
+                    "N": budget,
+                    "adaptive": adaptive,
+                    "parallel": args.parallel,
+                    "confidence": args.confidence,
+                    "totals": Counter(),
+                },
+            )
+            calls = Counter()
+            api.call_openai = simulated_model(
+                args.accuracy, args.latency, random.Random(args.seed), calls
+            )
+            results = asyncio.run(run(system, args.samples))
+            correct = sum(ok for ok, _ in results)
+            latency = statistics.mean(seconds for _, seconds in results)
+            print(
+                f"\nN={budget} {'adaptive' if adaptive else 'fixed'}: "
+                f"accuracy {correct / args.samples:.1%}, "
+                f"{calls['started'] / args.samples:.2f} model calls per sample, "
+                f"mean sample latency {latency:.2f} s"
+            )
+            print(f"  {system.report()}")
+
+
+if __name__ == "__main__":
+    main()
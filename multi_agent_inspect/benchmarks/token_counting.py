@@ -0,0 +1,79 @@
+"""
+Benchmark: gateway admission latency vs. history length.
+
+Before a request is queued the gateway hashes it (for the cache and coalescing) and counts
+its tokens (for the rate limiter). This grows a conversation one message at a time, as
+`Agent.chat_history` does, and measures that admission work per request, with the
+original full re-encoding and with the cached `TokenCounter`.
+
+    python -m benchmarks.token_counting --lengths 10 50 100 200
+"""
+
+import argparse
+import asyncio
+import time
+
+import tiktoken
+
+from chat.api import TOKEN_ENCODING_NAME
+from chat.cache import request_key
+from chat.tokens import TokenCounter
+
+RESPONSE_FORMAT = {"thinking": "Your step by step thinking.", "answer": "A, B, C or D."}
+
+
+def count_tokens_uncached(messages: list):
+    """The original `count_tokens`: loads the encoding and encodes every message."""
+    encoding = tiktoken.get_encoding(TOKEN_ENCODING_NAME)
+    num_tokens = 0
+    for message in messages:
+        num_tokens += 4
+        for val in message.values():
+            num_tokens += len(encoding.encode(val))
+    return num_tokens + 2
+
+
+def conversation(length: int) -> list:
+    messages = [{"role": "system", "content": "You are a helpful assistant. " * 20}]
+    for i in range(1, length):
+        role = "user" if i % 2 else "assistant"
+        messages.append({"role": role, "content": f"Turn {i}: " + "Thinking... " * 100})
+    return messages
+
+
+async def admit(messages: list, counter: TokenCounter) -> int:
+    request_key(messages, RESPONSE_FORMAT, "gpt-4o-mini", 0.5)
+    if counter is None:
+        return count_tokens_uncached(messages)
+    return await counter.acount(messages)
+
+
+async def run(length: int, cached: bool) -> float:
+    """Mean admission latency of the requests of a conversation growing to `length`."""
+    messages = conversation(length)
+    counter = TokenCounter(TOKEN_ENCODING_NAME) if cached else None
+    elapsed = 0.0
+    for n in range(1, length + 1):
+        start = time.perf_counter()
+        await admit(messages[:n], counter)
+        elapsed += time.perf_counter() - start
+    return elapsed / length
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 50, 100, 200])
+    args = parser.parse_args()
+
+    # Load the encoding up front so neither variant pays for the download
+    tiktoken.get_encoding(TOKEN_ENCODING_NAME)
+
+    print(f"{'messages':>8} {'uncached (ms)':>14} {'cached (ms)':>12}")
+    for length in args.lengths:
+        uncached = asyncio.run(run(length, cached=False))
+        cached = asyncio.run(run(length, cached=True))
+        print(f"{length:>8} {uncached * 1000:>14.3f} {cached * 1000:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,5 @@
 from .chat import *
+from .context import request_tags
+from .errors import GatewayError, GatewayOverloaded, JournalMiss, JournalMismatch
+from .journal import register_role
+from .tracing import enable_tracing, format_summary, span
@@ -1,4 +1,6 @@
-from fastapi import FastAPI
+import math
+from fastapi import FastAPI, Header
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 import asyncio
 import uuid
@@ -6,62 +8,311 @@ import time
 import json
 import logging
 import os
-from typing import Dict, Any
+from typing import Annotated, Dict, Optional
+import httpx
 import openai
-import tiktoken
 from dotenv import load_dotenv
-from concurrent.futures import ThreadPoolExecutor
+from .cache import ResponseCache, request_key
+from .mock import MockOpenAI
+from .errors import GatewayError, GatewayOverloaded, MissingFunctionCall
+from .concurrency import ConcurrencyLimit
+from .lanes import MODEL_LIMITS, Lane
+from .metrics import CONTENT_TYPE, Registry, serve
+from .retry import RetryPolicy, is_congestion, is_retryable
+from .scheduler import get_policy
+from .tokens import DEFAULT_ENCODING_NAME, shared_counter
+from . import tracing
 
 load_dotenv(override=True)
-client = openai.OpenAI()
 
 # ----------------------------------
 # CONFIGURATION & GLOBAL VARIABLES
 # ----------------------------------
-MAX_REQUESTS_PER_MINUTE = 5000  # adjust as needed
-MAX_TOKENS_PER_MINUTE = 2000000  # adjust as needed
-MAX_ATTEMPTS = 3
-TOKEN_ENCODING_NAME = "cl100k_base"
+MAX_REQUESTS_PER_MINUTE = int(os.getenv("GATEWAY_MAX_REQUESTS_PER_MINUTE", 5000))
+MAX_TOKENS_PER_MINUTE = int(os.getenv("GATEWAY_MAX_TOKENS_PER_MINUTE", 2000000))
+EXPECTED_COMPLETION_TOKENS = 300  # charged up front, reconciled against actual usage
+MAX_ATTEMPTS = 3  # per request, unless it asks for another budget
+RETRY_BASE_DELAY = 1.0  # seconds; doubled for every further retry, with jitter
+RETRY_MAX_DELAY = 60.0
+TOKEN_ENCODING_NAME = DEFAULT_ENCODING_NAME
 MODEL = "gpt-4o-mini"  # adjust as needed
-N = 80  # We'll dequeue one item every 1/N seconds
+# "openai", or "mock" for the offline stand-in in `chat.mock` (configured by MOCK_* variables)
+BACKEND = os.getenv("GATEWAY_BACKEND", "openai")
+# Maximum number of calls in flight to a model at once. This and the limits above apply
+# to each model separately; GATEWAY_MODEL_LIMITS overrides them per model (see `lanes`).
+MAX_CONCURRENT_CALLS = int(os.getenv("GATEWAY_MAX_CONCURRENT_CALLS", 2000))
+# The concurrency limit adapts between 1 and MAX_CONCURRENT_CALLS, starting from
+# INITIAL_CONCURRENT_CALLS, to the latency and rate limits observed (see `concurrency`),
+# unless ADAPTIVE_CONCURRENCY is off
+ADAPTIVE_CONCURRENCY = os.getenv("GATEWAY_ADAPTIVE_CONCURRENCY", "1") != "0"
+INITIAL_CONCURRENT_CALLS = int(os.getenv("GATEWAY_INITIAL_CONCURRENT_CALLS", 32))
+
+# Admission control: requests are rejected (HTTP 429 with Retry-After) once their model's
+# queue holds MAX_QUEUE_SIZE requests or a new request would wait longer than
+# MAX_QUEUE_WAIT seconds for the model's rate limits.
+MAX_QUEUE_SIZE = int(os.getenv("GATEWAY_MAX_QUEUE_SIZE", 10000))
+MAX_QUEUE_WAIT = float(os.getenv("GATEWAY_MAX_QUEUE_WAIT", 120))
+
+# The order queued requests are dispatched in: "fifo", "fair" (weighted fair queuing
+# across tasks) or "finish_started" (samples that started earlier go first)
+SCHEDULING_POLICY = os.getenv("GATEWAY_SCHEDULING_POLICY", "fifo")
+
+# On-disk response cache. For temperature > 0 the policy either reuses the first response
+# ("reuse") or collects CACHE_SAMPLES distinct responses per request ("sample").
+CACHE_ENABLED = os.getenv("GATEWAY_CACHE", "1") != "0"
+CACHE_PATH = os.getenv(
+    "GATEWAY_CACHE_PATH", os.path.join(os.path.dirname(__file__), "db", "cache.db")
+)
+CACHE_POLICY = os.getenv("GATEWAY_CACHE_POLICY", "reuse")
+CACHE_SAMPLES = int(os.getenv("GATEWAY_CACHE_SAMPLES", 1))
+CACHE_MAX_BYTES = int(os.getenv("GATEWAY_CACHE_MAX_BYTES", 1 << 30))
+
+# Also serve /metrics on this port from a background thread, e.g. when the gateway runs
+# in-process in an eval (0: only the app's /metrics)
+METRICS_PORT = int(os.getenv("GATEWAY_METRICS_PORT", 0))
+# Only local scrapers by default; set to 0.0.0.0 to expose the metrics to other hosts
+METRICS_HOST = os.getenv("GATEWAY_METRICS_HOST", "127.0.0.1")
 
 logging.basicConfig(level=logging.INFO)
 
-# We'll maintain a queue of requests to process.
-request_queue = asyncio.Queue()
+# The gateway's queue, futures, client and scheduler are bound to the event loop they
+# were started on (see `ensure_started`); the rate limiter and cache are process-wide.
+gateway_loop: asyncio.AbstractEventLoop = None
 
-# We'll maintain a dictionary of results keyed by request_id.
-results: Dict[str, Any] = {}
+# One async client, with a connection pool as large as the concurrency limit
+client: openai.AsyncOpenAI | MockOpenAI = None
 
-# We'll maintain a dictionary to hold pending results: request_id -> (result, event)
-pending_results: Dict[str, Any] = {}
+# Each model's requests wait in their own lane, ordered by the scheduling policy and
+# admitted against the model's request and token limits and concurrency limit.
+lanes: Dict[str, Lane] = {}
+
+# Failed calls are retried with exponential backoff, re-entering the queue
+retry_policy = RetryPolicy(RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+
+# Prompt tokens reported by the provider, and how many of them it served from its
+# prompt cache
+prompt_tokens = 0
+cached_prompt_tokens = 0
+
+# The number of requests rejected by admission control
+rejected_requests = 0
+
+# The number of failed calls retried, and of requests that failed for good
+retried_calls = 0
+failed_requests = 0
+
+# We'll maintain a dictionary to hold pending results: request_id -> future. Entries are
+# removed as soon as their result is delivered.
+pending_results: Dict[str, asyncio.Future] = {}
+
+# Created at startup if CACHE_ENABLED
+cache: ResponseCache = None
+
+# Requests in flight by request key, shared by identical requests: key -> future
+coalescing: Dict[str, asyncio.Future] = {}
+
+# The number of upstream calls saved by sharing an in-flight request's result
+coalesced_calls = 0
+
+# The number of callers waiting for each pending result, so that a request whose callers
+# have all been cancelled (e.g. by early stopping) is dropped before calling the model
+waiters: Dict[asyncio.Future, int] = {}
+
+# The number of queued requests dropped because nobody was waiting for them any more
+abandoned_requests = 0
+
+# Strong references to the gateway's tasks so they are not garbage collected
+in_flight = set()
 
 # To track requests per second, we'll keep counters
 calls_completed_in_current_second = 0
 last_log_time = time.time()
 
+# Exposed in the Prometheus text format by `/metrics`. Counters and histograms are
+# recorded as requests pass through; gauges are read from the lanes at scrape time.
+metrics = Registry()
+requests_metric = metrics.counter(
+    "gateway_requests_total",
+    "Requests submitted, by how they were served: cache, coalesced, queued or rejected.",
+    ("model", "served"),
+)
+queue_wait_metric = metrics.histogram(
+    "gateway_queue_wait_seconds",
+    "Time from (re)queueing a request to dispatching it to the model.",
+    ("model",),
+)
+latency_metric = metrics.histogram(
+    "gateway_upstream_latency_seconds",
+    "Latency of calls to the model, by outcome: ok or the error's class.",
+    ("model", "outcome"),
+)
+tokens_metric = metrics.counter(
+    "gateway_tokens_total", "Tokens used by calls to the model.", ("model",)
+)
+retries_metric = metrics.counter(
+    "gateway_retries_total", "Failed calls retried, by error class.", ("model", "error")
+)
+failures_metric = metrics.counter(
+    "gateway_failed_requests_total",
+    "Requests that failed for good, by error class.",
+    ("model", "error"),
+)
+abandoned_metric = metrics.counter(
+    "gateway_abandoned_requests_total",
+    "Queued or in-flight requests dropped because nobody waited for them any more.",
+)
+prompt_tokens_metric = metrics.counter(
+    "gateway_prompt_tokens_total",
+    "Prompt tokens reported by the model, and how many it served from its prompt cache.",
+    ("cached",),
+)
+cache_metric = metrics.counter(
+    "gateway_cache_lookups_total",
+    "Response cache lookups, by result: hit or miss.",
+    ("result",),
+)
+pending_metric = metrics.gauge(
+    "gateway_pending_requests", "Requests waiting for a result, queued or in flight."
+)
+queue_depth_metric = metrics.gauge(
+    "gateway_queue_depth", "Requests queued for the model.", ("model",)
+)
+queued_tokens_metric = metrics.gauge(
+    "gateway_queued_tokens", "Estimated tokens of the requests queued.", ("model",)
+)
+in_flight_metric = metrics.gauge(
+    "gateway_in_flight", "Calls to the model in flight.", ("model",)
+)
+concurrency_metric = metrics.gauge(
+    "gateway_concurrency_limit",
+    "Calls to the model allowed in flight: the current limit, or its maximum.",
+    ("model", "bound"),
+)
+rate_limit_metric = metrics.gauge(
+    "gateway_rate_limit_per_minute",
+    "The configured limits on requests and tokens per minute.",
+    ("model", "unit"),
+)
+
+# The server started for METRICS_PORT, if any
+metrics_server = None
+
+# Token counts of the messages seen so far, by content hash. The mock backend only needs
+# the approximation it reports usage with, which works offline.
+token_counter = shared_counter(
+    TOKEN_ENCODING_NAME if BACKEND != "mock" else None
+)
+
+
+class QueuedRequest:
+    """A request admitted to the gateway, from the queue until its last attempt."""
+
+    __slots__ = (
+        "req_id",
+        "messages",
+        "response_format",
+        "model",
+        "temperature",
+        "token_consumption",
+        "key",
+        "priority",
+        "attempt",
+        "max_attempts",
+        "enqueued",
+        "tags",
+    )
+
+    def __init__(
+        self,
+        req_id,
+        messages,
+        response_format,
+        model,
+        temperature,
+        token_consumption,
+        key,
+        max_attempts,
+        tags,
+    ):
+        self.req_id = req_id
+        self.messages = messages
+        self.response_format = response_format
+        self.model = model
+        self.temperature = temperature
+        self.token_consumption = token_consumption
+        self.key = key  # the cache key, if the response should be cached
+        self.priority = None
+        self.attempt = 1
+        self.max_attempts = max_attempts
+        self.enqueued = None  # when the request was last queued
+        self.tags = tags  # the client's request tags, for scheduling and tracing
+
+    @property
+    def estimated_tokens(self):
+        return self.token_consumption + EXPECTED_COMPLETION_TOKENS
+
+
+def get_lane(model: str) -> Lane:
+    """Returns the lane of a model, opening it (and starting its scheduler) if needed."""
+    lane = lanes.get(model)
+    if lane is None:
+        limits = MODEL_LIMITS.get(model, {})
+        lane = lanes[model] = Lane(
+            model,
+            limits.get("rpm", MAX_REQUESTS_PER_MINUTE),
+            limits.get("tpm", MAX_TOKENS_PER_MINUTE),
+            ConcurrencyLimit(
+                limits.get("concurrency", MAX_CONCURRENT_CALLS),
+                initial=limits.get("initial_concurrency", INITIAL_CONCURRENT_CALLS),
+                adaptive=ADAPTIVE_CONCURRENCY,
+            ),
+            get_policy(limits.get("scheduling_policy", SCHEDULING_POLICY)),
+        )
+        start_lane(lane)
+    return lane
+
+
+def start_lane(lane: Lane):
+    """Binds a lane to the gateway's event loop and starts its scheduler."""
+    lane.start()
+    task = gateway_loop.create_task(process_scheduler(lane))
+    in_flight.add(task)
+    task.add_done_callback(in_flight.discard)
+
+
+def admit(lane: Lane, token_consumption: int):
+    """
+    Raises GatewayOverloaded if the lane's queue is full or its queued work would keep a
+    new request waiting for longer than MAX_QUEUE_WAIT, shedding load before it builds up.
+    """
+    global rejected_requests
+    wait = lane.rate_limiter.time_to_admit(
+        lane.queue.qsize() + 1,
+        lane.queued_tokens + token_consumption + EXPECTED_COMPLETION_TOKENS,
+    )
+    if lane.queue.qsize() >= MAX_QUEUE_SIZE or wait > MAX_QUEUE_WAIT:
+        rejected_requests += 1
+        requests_metric.inc(model=lane.model, served="rejected")
+        raise GatewayOverloaded(retry_after=max(1, math.ceil(wait - MAX_QUEUE_WAIT)))
+
 
 def count_tokens(messages: list):
     """Count tokens for chat completion requests using tiktoken."""
-    encoding = tiktoken.get_encoding(TOKEN_ENCODING_NAME)
-    num_tokens = 0
-    for message in messages:
-        # 4 tokens for role/name delim and message, plus tokens for content
-        num_tokens += 4
-        for val in message.values():
-            num_tokens += len(encoding.encode(val))
-    num_tokens += 2  # every reply is primed with <im_start>assistant
-    return num_tokens
-
-
-def call_openai_sync(
+    return token_counter.count(messages)
+
+
+async def call_openai(
     messages: list,
     response_format: dict,
     model: str = MODEL,
     temperature: float = 0.5,
-    retry: int = 0,
+    insist: bool = False,
 ):
-    """Synchronous call to OpenAI, used in threadpool executor."""
+    """
+    Asynchronous call to OpenAI. Returns the structured response and the total number of
+    tokens used, or raises MissingFunctionCall if the model did not structure its
+    response. `insist` adds a stronger instruction, for retrying such a response.
+    """
     properties = {}
     required = []
     for key, value in response_format.items():
@@ -69,14 +320,21 @@ def call_openai_sync(
         required.append(key)
 
     # Add "Please use the "get_structured_response" function to structure the response." to the final message
-    messages.append(
+    messages = messages + [
         {
             "role": "system",
             "content": "Please use the 'get_structured_response' function to structure the response.",
         }
-    )
+    ]
+    if insist:
+        messages.append(
+            {
+                "role": "system",
+                "content": "YOU MUST use the 'get_structured_response' function to structure the response.",
+            }
+        )
 
-    response = client.chat.completions.create(
+    response = await client.chat.completions.create(
         model=model,
         temperature=temperature,
         messages=messages,
@@ -94,21 +352,20 @@ def call_openai_sync(
         function_call={"name": "get_structured_response"},
     )
 
+    global prompt_tokens, cached_prompt_tokens
+    total_tokens = response.usage.total_tokens if response.usage else 0
+    if response.usage:
+        prompt_tokens += response.usage.prompt_tokens
+        details = response.usage.prompt_tokens_details
+        if details is not None and details.cached_tokens:
+            cached_prompt_tokens += details.cached_tokens
+
     # Loading the response as a JSON object
-    if not response.choices[0].message.function_call and retry < 3:
-        logging.warning("Retrying due to missing function call.")
-        messages.append(
-            {
-                "role": "system",
-                "content": "YOU MUST use the 'get_structured_response' function to structure the response.",
-            }
-        )
-        response = call_openai_sync(
-            messages, response_format, model, temperature, retry + 1
-        )
+    if not response.choices[0].message.function_call:
+        raise MissingFunctionCall(total_tokens)
 
     json_response = json.loads(response.choices[0].message.function_call.arguments)
-    return json_response
+    return json_response, total_tokens
 
 
 app = FastAPI()
@@ -119,84 +376,304 @@ class GPTRequest(BaseModel):
     response_format: dict = {"response": "A response."}
     model: str = MODEL
     temperature: float = 0.5
+    # Distinguishes intentionally repeated samples of the same request in the cache
+    sample: int = 0
+    # Identify the task and sample the request belongs to, for scheduling
+    tags: dict = {}
+    # How many times the gateway may call the model for the request (MAX_ATTEMPTS if None)
+    max_attempts: Optional[int] = None
 
 
-@app.post("/gpt")
-async def gpt_endpoint(req: GPTRequest):
-    token_consumption = count_tokens(req.messages)
-    req_id = str(time.time()) + "_" + str(id(req))
+async def submit(
+    messages: list,
+    response_format: dict,
+    model: str = MODEL,
+    temperature: float = 0.5,
+    sample: int = 0,
+    use_cache: bool = True,
+    coalesce: bool = True,
+    tags: dict = {},
+    max_attempts: Optional[int] = None,
+) -> dict:
+    """
+    Queues a request with the throttling scheduler (or answers it from the cache or an
+    identical request in flight) and waits for its result. Raises GatewayOverloaded if
+    the request is not admitted, or GatewayError if it failed after `max_attempts` calls
+    (MAX_ATTEMPTS by default) or with an error that retrying cannot fix. `tags`
+    ({"task": ..., "sample": ...}) are used by the scheduling policy.
+
+    This is the gateway's core: `/gpt` calls it for HTTP clients, and the in-process
+    transport of `chat.chat` calls it directly on the caller's event loop.
+    """
+    ensure_started()
+    req_id = str(uuid.uuid4())
+    key = request_key(messages, response_format, model, temperature, sample)
+
+    # Serve repeated requests from the cache, unless the client asked to bypass it.
+    # SQLite is queried on a worker thread so the event loop never waits on the disk.
+    use_cache = use_cache and cache is not None
+    if use_cache:
+        cached = await asyncio.to_thread(cache.get, key, temperature)
+        if cached is not None:
+            requests_metric.inc(model=model, served="cache")
+            return {"request_id": req_id, "result": cached, "cached": True}
+
+    # Identical requests already in flight share their result, unless the client asked
+    # for an independent call (e.g. to draw several samples of a stochastic request)
+    if coalesce and key in coalescing:
+        return await join(req_id, model, key)
+
+    lane = get_lane(model)
+    token_consumption = await token_counter.acount(messages)
+    # An identical request may have been queued while the tokens were being counted
+    if coalesce and key in coalescing:
+        return await join(req_id, model, key)
+    admit(lane, token_consumption)
+    requests_metric.inc(model=model, served="queued")
     logging.info(
         f"Queueing request {req_id} with token consumption {token_consumption}"
     )
 
-    event = asyncio.Event()
-    pending_results[req_id] = (None, event)
+    result = asyncio.get_running_loop().create_future()
+    pending_results[req_id] = result
+    # The result is delivered while anyone, this request or those sharing it, waits for it
+    result.add_done_callback(lambda _: pending_results.pop(req_id, None))
+    if coalesce:
+        coalescing[key] = result
+        result.add_done_callback(
+            lambda f: coalescing.pop(key) if coalescing.get(key) is f else None
+        )
+
+    request = QueuedRequest(
+        req_id,
+        messages,
+        response_format,
+        model,
+        temperature,
+        token_consumption,
+        key if use_cache else None,
+        max_attempts or MAX_ATTEMPTS,
+        tags,
+    )
+    request.priority = lane.scheduling_policy.priority(tags, request.estimated_tokens)
+    enqueue(request)
+
+    return {"request_id": req_id, "result": await wait_for(result)}
+
+
+async def join(req_id: str, model: str, key: str) -> dict:
+    """Waits for the result of the identical request in flight under `key`."""
+    global coalesced_calls
+    coalesced_calls += 1
+    requests_metric.inc(model=model, served="coalesced")
+    result = await wait_for(coalescing[key])
+    return {"request_id": req_id, "result": result, "coalesced": True}
+
+
+async def wait_for(result: asyncio.Future):
+    """
+    Waits for a pending result shared by several callers. Cancelling a caller doesn't
+    cancel the result, unless it was the last caller waiting for it, which abandons the
+    request whether it is still queued or already calling the model.
+    """
+    waiters[result] = waiters.get(result, 0) + 1
+    try:
+        return await asyncio.shield(result)
+    finally:
+        waiters[result] -= 1
+        if not waiters[result]:
+            del waiters[result]
+            if not result.done():
+                result.cancel()
 
-    await request_queue.put(
-        (
-            req_id,
+
+@app.post("/gpt")
+async def gpt_endpoint(
+    req: GPTRequest,
+    x_cache_bypass: Annotated[bool, Header()] = False,
+    x_coalesce_bypass: Annotated[bool, Header()] = False,
+):
+    try:
+        return await submit(
             req.messages,
             req.response_format,
             req.model,
             req.temperature,
-            MAX_ATTEMPTS,
-            token_consumption,
+            req.sample,
+            use_cache=not x_cache_bypass,
+            coalesce=not x_coalesce_bypass,
+            tags=req.tags,
+            max_attempts=req.max_attempts,
         )
-    )
-
-    await event.wait()
-    result, _ = pending_results[req_id]
-    return {"request_id": req_id, "result": result}
+    except GatewayOverloaded as e:
+        return JSONResponse(
+            status_code=429,
+            content={"error": str(e)},
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    except GatewayError as e:
+        return JSONResponse(status_code=e.status_code, content={"error": str(e)})
 
 
-# Global executor for concurrent calls
-executor = ThreadPoolExecutor(max_workers=N)
+def enqueue(request: QueuedRequest):
+    """Queues an admitted request (or a retry of one) behind its model's rate limiter."""
+    lane = get_lane(request.model)
+    lane.queued_tokens += request.estimated_tokens
+    request.enqueued = time.monotonic()
+    lane.queue.put_nowait((request.priority, request))
 
 
-def future_callback(fut, req_id):
-    """Callback when a future completes."""
-    global calls_completed_in_current_second
-    exc = fut.exception()
-    if exc:
-        # If there's an exception, you could handle retries or store error
-        logging.error(f"Error in processing {req_id}: {exc}")
-        result = {"error": str(exc)}
+def requeue(request: QueuedRequest, delay: float):
+    """Queues a failed request again once its backoff `delay` has passed."""
+    tracing.record(
+        "backoff", "gateway", delay, request.tags, attempt=request.attempt - 1
+    )
+    enqueue(request)
+
+
+def resolve(req_id: str, result: dict = None, error: Exception = None):
+    """Delivers a request's result (or error) to everyone waiting for it."""
+    pending = pending_results.get(req_id)
+    if pending is not None and not pending.done():
+        if error is not None:
+            pending.set_exception(error)
+        else:
+            pending.set_result(result)
+
+
+async def dispatch(lane: Lane, request: QueuedRequest):
+    """
+    Calls OpenAI for a request, caches the response and resolves its pending result.
+
+    A retryable failure puts the request back in the queue after a backoff delay (without
+    holding a concurrency slot), so the retry is rate limited like any other call. The
+    dispatch is cancelled if everyone waiting for the result gives up (see `wait_for`);
+    an abandoned call's tokens are given back to the rate limiter.
+    """
+    global calls_completed_in_current_second, retried_calls, failed_requests
+    global abandoned_requests
+    started = time.monotonic()
+    try:
+        result, total_tokens = await call_openai(
+            request.messages,
+            request.response_format,
+            request.model,
+            request.temperature,
+            insist=request.attempt > 1,
+        )
+    except asyncio.CancelledError:
+        abandoned_requests += 1
+        lane.rate_limiter.reconcile(request.estimated_tokens, 0)
+        raise
+    except Exception as exc:
+        error = type(exc).__name__
+        latency = time.monotonic() - started
+        latency_metric.observe(latency, model=lane.model, outcome=error)
+        tracing.record(
+            "upstream",
+            "gateway",
+            latency,
+            request.tags,
+            attempt=request.attempt,
+            outcome=error,
+        )
+        # Refused calls are not charged, but a malformed response used its tokens
+        tokens_metric.inc(getattr(exc, "total_tokens", 0), model=lane.model)
+        lane.rate_limiter.reconcile(
+            request.estimated_tokens, getattr(exc, "total_tokens", 0)
+        )
+        # Only the provider's errors say how it copes, not e.g. a malformed response
+        if isinstance(exc, openai.APIError):
+            lane.concurrency.failed(congestion=is_congestion(exc))
+        if is_retryable(exc) and request.attempt < request.max_attempts:
+            delay = retry_policy.delay(request.attempt, exc)
+            logging.warning(
+                f"Retrying {request.req_id} in {delay:.1f}s after attempt "
+                f"{request.attempt} failed: {exc}"
+            )
+            request.attempt += 1
+            retried_calls += 1
+            retries_metric.inc(model=lane.model, error=error)
+            asyncio.get_running_loop().call_later(delay, requeue, request, delay)
+            return
+
+        logging.error(f"Error in processing {request.req_id}: {exc}")
+        failed_requests += 1
+        failures_metric.inc(model=lane.model, error=error)
+        # Errors in the request itself keep their status; 429 is reserved for admission
+        status_code = getattr(exc, "status_code", 502)
+        if not 400 <= status_code < 500 or status_code == 429:
+            status_code = 502
+        resolve(
+            request.req_id,
+            error=GatewayError(
+                f"Failed after {request.attempt} attempt(s): {exc}", status_code
+            ),
+        )
     else:
-        result = fut.result()
-    # Set the result and trigger the event so the waiting request can return
-    res, event = pending_results[req_id]
-    pending_results[req_id] = (result, event)
-    event.set()
+        latency = time.monotonic() - started
+        latency_metric.observe(latency, model=lane.model, outcome="ok")
+        tracing.record(
+            "upstream", "gateway", latency, request.tags, attempt=request.attempt
+        )
+        tokens_metric.inc(total_tokens, model=lane.model)
+        lane.concurrency.succeeded(latency)
+        lane.rate_limiter.reconcile(request.estimated_tokens, total_tokens)
+        if request.key is not None:
+            # A failed cache write loses only the cached copy, never the response. The
+            # result is delivered once it is written, so a later identical request hits.
+            try:
+                await asyncio.to_thread(
+                    cache.put, request.key, request.temperature, result
+                )
+            except Exception as exc:
+                logging.error(f"Could not cache the response to {request.req_id}: {exc}")
+        resolve(request.req_id, result)
+    finally:
+        lane.concurrency.release()
+
     calls_completed_in_current_second += 1
 
 
-async def process_scheduler():
-    """A scheduler task that tries to dequeue 1 item every 1/N seconds."""
+async def process_scheduler(lane: Lane):
+    """
+    A lane's scheduler task: dispatches the lane's queued requests, in the order of its
+    scheduling policy, as soon as a slot under the lane's (adaptive) concurrency limit
+    is free and the lane's rate limiter admits them, charging their prompt tokens plus
+    the expected completion tokens.
+    """
+    global abandoned_requests
     while True:
-        try:
-            item = request_queue.get_nowait()
-        except asyncio.QueueEmpty:
-            # If queue is empty, just sleep for 1/N second
-            await asyncio.sleep(1.0 / N)
+        priority, request = await lane.queue.get()
+        lane.scheduling_policy.dequeued(priority)
+        lane.queued_tokens -= request.estimated_tokens
+
+        # Skip requests whose callers have all gone (their result was cancelled)
+        if request.req_id not in pending_results:
+            abandoned_requests += 1
             continue
 
-        (
-            req_id,
-            messages,
-            response_format,
-            model,
-            temperature,
-            attempts_left,
-            token_consumption,
-        ) = item
-        # Submit the call to executor immediately, no waiting
-        fut = executor.submit(
-            call_openai_sync, messages, response_format, model, temperature
-        )
-        fut.add_done_callback(lambda f, r=req_id: future_callback(f, r))
+        await lane.concurrency.acquire()
+        await lane.rate_limiter.acquire(request.estimated_tokens)
+
+        # ...or gave up while it waited for a slot
+        if request.req_id not in pending_results:
+            abandoned_requests += 1
+            lane.rate_limiter.reconcile(request.estimated_tokens, 0)
+            lane.concurrency.release()
+            continue
 
-        # Sleep 1/N second before trying to dequeue next item
-        await asyncio.sleep(1.0 / N)
+        wait = time.monotonic() - request.enqueued
+        queue_wait_metric.observe(wait, model=lane.model)
+        tracing.record("queue", "gateway", wait, request.tags, attempt=request.attempt)
+        # Start the call immediately, no waiting; the slot is released when it completes
+        task = asyncio.create_task(dispatch(lane, request))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        # The call is abandoned once nobody waits for its result any more
+        pending_results[request.req_id].add_done_callback(
+            lambda result, task=task: task.cancel() if result.cancelled() else None
+        )
 
 
 async def log_rate():
@@ -209,11 +686,106 @@ async def log_rate():
         calls_completed_in_current_second = 0
 
 
+@app.get("/stats")
+async def stats_endpoint():
+    return {
+        "cache": await asyncio.to_thread(cache.stats) if cache is not None else None,
+        "coalesced_calls": coalesced_calls,
+        "prompt_tokens": prompt_tokens,
+        "cached_prompt_tokens": cached_prompt_tokens,
+        "abandoned_requests": abandoned_requests,
+        "queue_depth": sum(lane.queue.qsize() for lane in lanes.values()),
+        "lanes": {model: lane.stats() for model, lane in lanes.items()},
+        "pending_results": len(pending_results),
+        "rejected_requests": rejected_requests,
+        "retried_calls": retried_calls,
+        "failed_requests": failed_requests,
+    }
+
+
+def render_metrics() -> str:
+    """The gateway's metrics in the Prometheus text format, with the gauges read now."""
+    pending_metric.set(len(pending_results))
+    abandoned_metric.set(abandoned_requests)
+    prompt_tokens_metric.set(prompt_tokens - cached_prompt_tokens, cached="false")
+    prompt_tokens_metric.set(cached_prompt_tokens, cached="true")
+    if cache is not None:
+        cache_metric.set(cache.hits, result="hit")
+        cache_metric.set(cache.misses, result="miss")
+    for model, lane in list(lanes.items()):
+        concurrency, limiter = lane.concurrency, lane.rate_limiter
+        queue_depth_metric.set(lane.queue.qsize(), model=model)
+        queued_tokens_metric.set(lane.queued_tokens, model=model)
+        in_flight_metric.set(concurrency.in_flight, model=model)
+        concurrency_metric.set(int(concurrency.limit), model=model, bound="current")
+        concurrency_metric.set(concurrency.maximum, model=model, bound="maximum")
+        rate_limit_metric.set(limiter.requests.capacity, model=model, unit="requests")
+        rate_limit_metric.set(limiter.tokens.capacity, model=model, unit="tokens")
+    return metrics.render()
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
+
+@app.get("/trace")
+async def trace_endpoint():
+    """The gateway's spans as a Chrome trace, when tracing is on (see `tracing`)."""
+    if tracing.tracer is None:
+        return JSONResponse(status_code=404, content={"error": "Tracing is off"})
+    return tracing.tracer.chrome_trace()
+
+
+def ensure_started():
+    """
+    Starts the gateway on the running event loop, unless it is already running there.
+
+    Starting it on a new loop (e.g. for the next of several evals run in turn) replaces
+    the loop-bound state: the lanes' queues and schedulers, in-flight requests and client.
+    """
+    global gateway_loop, client, pending_results, coalescing, waiters, in_flight, cache
+    global metrics_server
+    loop = asyncio.get_running_loop()
+    if gateway_loop is loop:
+        return
+
+    gateway_loop = loop
+    if BACKEND == "mock":
+        client = MockOpenAI.from_env()
+    else:
+        # Retries are handled by the gateway, behind its rate limiter
+        client = openai.AsyncOpenAI(
+            max_retries=0,
+            http_client=openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    # Calls are bounded per model by the lanes
+                    max_connections=None,
+                    max_keepalive_connections=MAX_CONCURRENT_CALLS,
+                ),
+            ),
+        )
+    pending_results = {}
+    coalescing = {}
+    waiters = {}
+    in_flight = set()
+    if CACHE_ENABLED and cache is None:
+        cache = ResponseCache(CACHE_PATH, CACHE_POLICY, CACHE_SAMPLES, CACHE_MAX_BYTES)
+    if METRICS_PORT and metrics_server is None:
+        metrics_server = serve(render_metrics, METRICS_PORT, METRICS_HOST)
+
+    # Restart the lanes opened on a previous loop (their rate limits carry over), and
+    # the logger
+    for lane in lanes.values():
+        start_lane(lane)
+    task = loop.create_task(log_rate())
+    in_flight.add(task)
+    task.add_done_callback(in_flight.discard)
+
+
 @app.on_event("startup")
 async def startup_event():
-    # Start scheduler and logger tasks
-    asyncio.create_task(process_scheduler())
-    asyncio.create_task(log_rate())
+    ensure_started()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+def request_key(
+    messages: list, response_format: dict, model: str, temperature: float, sample: int = 0
+) -> str:
+    """
+    A canonical hash of a request: identical requests hash identically regardless of key
+    order or whitespace in their JSON.
+    """
+    payload = json.dumps(
+        {
+            "messages": messages,
+            "response_format": response_format,
+            "model": model,
+            "temperature": temperature,
+            "sample": sample,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    An on-disk cache of LLM responses, keyed by `request_key`.
+
+    Deterministic requests (temperature 0) always reuse their single stored response. For
+    stochastic requests the policy decides:
+
+    - "reuse": the first response stored for a key is returned for every later request.
+    - "sample": up to `samples` distinct responses are stored per key; a key only hits
+      once all of them have been collected, after which a random one is returned.
+
+    The cache is bounded to `max_bytes` of stored responses, evicting the least recently
+    used entries first. Hits only note when an entry was used; the notes are written in
+    batches (with the next write, or every `touch_batch` hits) so lookups stay cheap.
+    Every method is safe to call from any thread; the gateway calls them on worker
+    threads so that SQLite never blocks its event loop.
+
+    Attributes:
+        hits (int): The number of lookups answered from the cache.
+        misses (int): The number of lookups that had to call the model.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        policy: str = "reuse",
+        samples: int = 1,
+        max_bytes: int = 1 << 30,
+        touch_batch: int = 256,
+    ):
+        if policy not in ("reuse", "sample"):
+            raise ValueError(f"Unknown cache policy '{policy}'")
+        self.path = path
+        self.policy = policy
+        self.samples = max(1, samples)
+        self.max_bytes = max_bytes
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        # When entries were last used, not yet written: (key, slot) -> time
+        self._touched = {}
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT NOT NULL,
+                slot INTEGER NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (key, slot)
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)"
+        )
+        self._connection.commit()
+        (self.size,) = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+
+    def _slots(self, temperature: float) -> int:
+        if temperature > 0 and self.policy == "sample":
+            return self.samples
+        return 1
+
+    def get(self, key: str, temperature: float) -> Optional[dict]:
+        """Returns a cached response for the key, or None on a miss."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT slot, response FROM responses WHERE key = ?", (key,)
+            ).fetchall()
+            if len(rows) < self._slots(temperature):
+                self.misses += 1
+                return None
+
+            slot, response = random.choice(rows)
+            self._touched[(key, slot)] = time.time()
+            if len(self._touched) >= self.touch_batch:
+                self._write_touches()
+                self._connection.commit()
+            self.hits += 1
+            return json.loads(response)
+
+    def _write_touches(self):
+        self._connection.executemany(
+            "UPDATE responses SET last_used = ? WHERE key = ? AND slot = ?",
+            [(used, key, slot) for (key, slot), used in self._touched.items()],
+        )
+        self._touched.clear()
+
+    def put(self, key: str, temperature: float, response: dict):
+        """Stores a response for the key, unless the key already has all its samples."""
+        data = json.dumps(response, ensure_ascii=False)
+        with self._lock:
+            # Slots freed by eviction may be anywhere, so the new one goes after the last
+            stored, slot = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(MAX(slot) + 1, 0) FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if stored >= self._slots(temperature):
+                return
+
+            self._connection.execute(
+                "INSERT INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, slot, data, len(data), time.time()),
+            )
+            self.size += len(data)
+            self._write_touches()
+            if self.size > self.max_bytes:
+                self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        # Drop least recently used entries until the cache is back under 90% of its bound
+        target = self.max_bytes * 0.9
+        rows = self._connection.execute(
+            "SELECT key, slot, size FROM responses ORDER BY last_used"
+        )
+        evicted = []
+        for key, slot, size in rows:
+            if self.size <= target:
+                break
+            evicted.append((key, slot))
+            self.size -= size
+        self._connection.executemany(
+            "DELETE FROM responses WHERE key = ? AND slot = ?", evicted
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._connection.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "bytes": self.size,
+            "policy": self.policy,
+        }
+
+    def close(self):
+        with self._lock:
+            self._write_touches()
+            self._connection.commit()
+            self._connection.close()
@@ -1,25 +1,169 @@
 from dotenv import load_dotenv
 import asyncio
+import os
 import httpx
+from .context import current_tags
+from .errors import GatewayError, JournalMiss, JournalMismatch
+from .journal import Journal, request_digest
+from .tracing import span
 
 load_dotenv(override=True)
 
 client = httpx.AsyncClient()
 URL = "http://localhost:8000/gpt"
 
+# "inprocess" submits requests straight to the throttling scheduler in `chat.api` on the
+# caller's event loop; "http" posts them to a gateway running in another process.
+TRANSPORTS = ("inprocess", "http")
+TRANSPORT = os.getenv("GATEWAY_TRANSPORT", "inprocess")
+
+# Record every agent's responses to a journal, or replay them from one (see `open_journal`)
+journal: Journal = None
+
+
+def open_journal(path: str, mode: str) -> Journal:
+    """
+    Records the responses to every agent's LLM calls to a journal ("record"), or serves
+    them from one instead of calling the model ("replay"). Also enabled by setting
+    LLM_JOURNAL to the mode (and LLM_JOURNAL_PATH to the file).
+    """
+    global journal
+    if journal is not None:
+        journal.close()
+    journal = Journal(path, mode)
+    return journal
+
+
+if os.getenv("LLM_JOURNAL"):
+    open_journal(
+        os.getenv(
+            "LLM_JOURNAL_PATH",
+            os.path.join(os.path.dirname(__file__), "db", "journal.jsonl"),
+        ),
+        os.getenv("LLM_JOURNAL"),
+    )
+
+
+def set_transport(transport: str):
+    """Selects how requests reach the gateway; call it before running any agents."""
+    global TRANSPORT
+    if transport not in TRANSPORTS:
+        raise ValueError(f"Unknown transport '{transport}', expected one of {TRANSPORTS}")
+    TRANSPORT = transport
+
 
 async def get_structured_json_response_from_gpt(
-    messages, response_format, model="gpt-4o-mini", temperature=0.5, retry=0
+    messages,
+    response_format,
+    model="gpt-4o-mini",
+    temperature=0.5,
+    retry=0,
+    sample=0,
+    cache=True,
+    coalesce=True,
+    max_attempts=None,
+    agent_id=None,
+    agent_role=None,
 ) -> dict:
+    """
+    Requests a structured response from the gateway. `sample` distinguishes intentionally
+    repeated samples of the same request in the gateway's response cache, and
+    `cache=False` bypasses that cache. `coalesce=False` makes an independent call even if
+    an identical request is already in flight. `max_attempts` overrides how many times
+    the gateway may call the model for the request; if every attempt fails (or the
+    request itself is invalid) a GatewayError is raised.
+
+    Calls made on behalf of an agent (`agent_id`, `agent_role`) are recorded to, or
+    replayed from, the journal if one is open. Replaying a call raises JournalMiss if
+    the journal has no response for it, or JournalMismatch if its request differs from
+    the one recorded.
+
+    Requests are tagged for the gateway's scheduler with the current `request_tags`.
+    When the gateway is saturated the request waits for as long as it asks (Retry-After)
+    and tries again.
+    """
+
+    key = None
+    if journal is not None and agent_id is not None:
+        key = journal.key(current_tags().get("sample", ""), agent_id, agent_role)
+        digest = request_digest(messages, response_format, model, temperature)
+        if journal.mode == "replay":
+            recorded = journal.lookup(key)
+            if recorded is None:
+                raise JournalMiss(key)
+            recorded_digest, response = recorded
+            if recorded_digest != digest:
+                raise JournalMismatch(key)
+            return dict(response)
+
+    transport = _submit if TRANSPORT == "inprocess" else _post
+    with span(TRANSPORT, "transport", model=model):
+        data = await transport(
+            messages,
+            response_format,
+            model,
+            temperature,
+            sample,
+            cache,
+            coalesce,
+            max_attempts,
+        )
+
+    if key is not None:
+        journal.record(key, digest, data)
+    return data
+
+
+async def _submit(
+    messages, response_format, model, temperature, sample, cache, coalesce, max_attempts
+):
+    """Submits a request to the gateway running on this event loop."""
+    # Imported here so that only the in-process transport loads the gateway
+    from . import api
+
+    while True:
+        try:
+            response = await api.submit(
+                messages,
+                response_format,
+                model,
+                temperature,
+                sample,
+                use_cache=cache,
+                coalesce=coalesce,
+                tags=current_tags(),
+                max_attempts=max_attempts,
+            )
+            return response["result"]
+        except api.GatewayOverloaded as e:
+            await asyncio.sleep(e.retry_after)
+
 
+async def _post(
+    messages, response_format, model, temperature, sample, cache, coalesce, max_attempts
+):
+    """Posts a request to the gateway's HTTP endpoint."""
     payload = {
         "messages": messages,
         "response_format": response_format,
         "model": model,
         "temperature": temperature,
+        "sample": sample,
+        "tags": current_tags(),
+        "max_attempts": max_attempts,
     }
+    headers = {}
+    if not cache:
+        headers["X-Cache-Bypass"] = "1"
+    if not coalesce:
+        headers["X-Coalesce-Bypass"] = "1"
 
-    response = await client.post(URL, json=payload, timeout=None)
+    response = await client.post(URL, json=payload, headers=headers, timeout=None)
+    while response.status_code == 429:
+        await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+        response = await client.post(URL, json=payload, headers=headers, timeout=None)
+    if response.status_code != 200:
+        raise GatewayError(response.json().get("error"), response.status_code)
 
     data = response.json()["result"]
 
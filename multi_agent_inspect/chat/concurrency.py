@@ -0,0 +1,140 @@
+import asyncio
+import time
+from collections import deque
+
+
+class ConcurrencyLimit:
+    """
+    Limits the calls to a model in flight, adapting the limit to how the provider copes
+    (additive increase, multiplicative decrease, as in TCP congestion control).
+
+    The limit starts at `initial` and, like TCP's slow start, grows by one for every
+    successful call (doubling every round trip) until the first sign of congestion. From
+    then on it grows by one per round trip's worth of successful calls (`increase /
+    limit` per call). A rate limit (429) or timeout cuts it to `decrease` times its value,
+    at most once per round trip so that a burst of failures from the same overload counts
+    once. While calls are slow or failing with server errors, the limit holds instead of
+    growing. Calls are slow when their average latency exceeds `latency_tolerance` times
+    the baseline: the lowest average over the last `baseline_window` successful calls.
+    The baseline is set after `warmup` calls, once the average has settled, and moves
+    with the window. A lucky early average therefore doesn't hold the limit down for
+    good.
+
+    With `adaptive` off the limit stays at `maximum`, like a semaphore.
+
+    Attributes:
+        limit (float): The current limit; `int(limit)` calls may be in flight.
+        in_flight (int): The number of calls in flight.
+        decisions (dict): How often the limit was increased, decreased or held.
+    """
+
+    def __init__(
+        self,
+        maximum: int,
+        initial: int = 32,
+        minimum: int = 1,
+        adaptive: bool = True,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+        smoothing: float = 0.1,
+        warmup: int = 20,
+        baseline_window: int = 1000,
+    ):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.adaptive = adaptive
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.warmup = warmup
+        self.baseline_window = baseline_window
+        self.limit = float(min(initial, maximum) if adaptive else maximum)
+        self.slow_start = True
+        self.latency = None  # moving average of successful calls' latency
+        self.baseline = None  # the lowest moving average in the window
+        self.successes = 0
+        # (success number, moving average) for the window's candidates for its minimum,
+        # in increasing order of both
+        self._minima = deque()
+        self.last_decrease = -float("inf")
+        self.decisions = {"increase": 0, "decrease": 0, "hold": 0}
+        self.in_flight = 0
+        self._slot_freed = None
+
+    def start(self):
+        """Binds the limit to the running event loop; the learnt limit carries over."""
+        self.in_flight = 0
+        self._slot_freed = asyncio.Event()
+
+    async def acquire(self):
+        while self.in_flight >= int(self.limit):
+            self._slot_freed.clear()
+            await self._slot_freed.wait()
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._slot_freed.set()
+
+    def succeeded(self, latency: float):
+        """Records a successful call that took `latency` seconds."""
+        if not self.adaptive:
+            return
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.smoothing * (latency - self.latency)
+        self.successes += 1
+
+        if self.successes > self.warmup:
+            while self._minima and self._minima[-1][1] >= self.latency:
+                self._minima.pop()
+            self._minima.append((self.successes, self.latency))
+            if self._minima[0][0] <= self.successes - self.baseline_window:
+                self._minima.popleft()
+            self.baseline = self._minima[0][1]
+
+        if self.baseline is not None and (
+            self.latency > self.baseline * self.latency_tolerance
+        ):
+            self.decisions["hold"] += 1
+            return
+        step = self.increase if self.slow_start else self.increase / self.limit
+        self._resize(self.limit + step, "increase")
+
+    def failed(self, congestion: bool):
+        """
+        Records a failed call: `congestion` for a rate limit or timeout, which cuts the
+        limit, otherwise (e.g. a server error) the limit holds.
+        """
+        if not self.adaptive:
+            return
+        now = time.monotonic()
+        round_trip = self.latency or 0.0
+        if not congestion or now - self.last_decrease < round_trip:
+            self.decisions["hold"] += 1
+            return
+        self.slow_start = False
+        self.last_decrease = now
+        self._resize(self.limit * self.decrease, "decrease")
+
+    def _resize(self, limit: float, decision: str):
+        previous = self.limit
+        self.limit = min(max(limit, self.minimum), self.maximum)
+        self.decisions[decision if self.limit != previous else "hold"] += 1
+        if self._slot_freed is not None:
+            self._slot_freed.set()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "max_concurrent": self.maximum,
+            "adaptive": self.adaptive,
+            "slow_start": self.slow_start,
+            "latency": self.latency,
+            "baseline_latency": self.baseline,
+            "decisions": dict(self.decisions),
+        }
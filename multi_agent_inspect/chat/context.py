@@ -0,0 +1,28 @@
+import contextlib
+import contextvars
+
+# Tags attached to every request made in the current context, e.g. {"task": ..., "sample": ...}
+_request_tags = contextvars.ContextVar("request_tags", default={})
+
+
+def current_tags() -> dict:
+    """The tags of requests made in the current context."""
+    return _request_tags.get()
+
+
+@contextlib.contextmanager
+def request_tags(**tags):
+    """
+    Tags every request made within the block (including by tasks it starts), so the
+    gateway can schedule them by task and sample:
+
+        with request_tags(task="COTAgentSystem", sample="COTAgentSystem/12/1"):
+            await system.forward(task)
+
+    Nested blocks add to the enclosing tags.
+    """
+    token = _request_tags.set({**_request_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _request_tags.reset(token)
@@ -0,0 +1,42 @@
+class GatewayError(Exception):
+    """Raised when the gateway could not get a response for a request."""
+
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class GatewayOverloaded(GatewayError):
+    """Raised when a request is not admitted; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Gateway overloaded, retry after {retry_after:.0f}s", 429)
+        self.retry_after = retry_after
+
+
+class JournalMiss(GatewayError):
+    """Raised when replaying a journal that has no response recorded for a call."""
+
+    def __init__(self, key: tuple):
+        super().__init__(f"No response recorded for call {key}", 404)
+        self.key = key
+
+
+class JournalMismatch(GatewayError):
+    """Raised when replaying a call that differs from the one recorded under its key."""
+
+    def __init__(self, key: tuple):
+        super().__init__(
+            f"Call {key} does not match the request recorded for it; the journal was "
+            "recorded from a different evaluation, prompt or model",
+            409,
+        )
+        self.key = key
+
+
+class MissingFunctionCall(Exception):
+    """The model answered without calling the structured response function."""
+
+    def __init__(self, total_tokens: int = 0):
+        super().__init__("Response did not use the 'get_structured_response' function")
+        self.total_tokens = total_tokens
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Every agent role (see `register_role`), and a pattern matching names made from them
+_roles = set()
+_names = None
+
+
+def register_role(role: str):
+    """
+    Notes a role that agents' names are made from, followed by a random suffix (see
+    `base.agent.display_name`), so that `request_digest` can strip the suffix.
+    """
+    global _names
+    if role not in _roles:
+        _roles.add(role)
+        _names = None
+
+
+def request_digest(
+    messages: list, response_format: dict, model: str, temperature: float
+) -> str:
+    """
+    A hash of a request that is identical between runs: the random suffixes of agents'
+    names are stripped before hashing.
+    """
+    global _names
+    payload = json.dumps(
+        [messages, response_format, model, temperature],
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    if _roles:
+        if _names is None:
+            # Longest first, so a role that extends another is stripped as a whole
+            roles = sorted(_roles, key=len, reverse=True)
+            _names = re.compile(
+                f"({'|'.join(map(re.escape, roles))}) [A-Za-z0-9]{{4}}\\b"
+            )
+        payload = _names.sub(r"\1", payload)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class Journal:
+    """
+    An append-only record of the responses to every LLM call of an evaluation, to replay
+    it later without calling the model.
+
+    A call is keyed by what stays the same between runs of an evaluation: the sample it
+    belongs to (from `request_tags`), the calling agent's role (its name without the
+    random suffix), the agent's index among the agents with that role in the sample (in
+    the order they first call the model) and the call's ordinal among that agent's calls.
+    Message contents can't be part of the key, as they include the agents' random names.
+    Instead each call also records the `request_digest` of its request, so replay can
+    tell when a call is not the one recorded.
+
+    Each call is one compact JSON line, `[sample, role, index, ordinal, digest,
+    response]`. In "record" mode lines are appended as responses arrive; in "replay" mode
+    the file is loaded into memory once and responses are served from there (the last
+    one recorded for a key wins).
+
+    Attributes:
+        path (str): The journal file.
+        mode (str): "record" or "replay".
+    """
+
+    def __init__(self, path: str, mode: str, max_samples: int = 100_000):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown journal mode '{mode}'")
+        self.path = path
+        self.mode = mode
+        self.max_samples = max_samples
+        # sample -> {"agents": {agent_id: (role, index)}, "roles": {role: count},
+        #            "calls": {agent_id: count}}, for the most recent samples
+        self._samples = OrderedDict()
+        self._lock = threading.Lock()
+        self._responses = {}
+        self._file = None
+
+        if mode == "replay":
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    *key, digest, response = json.loads(line)
+                    self._responses[tuple(key)] = (digest, response)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8")
+
+    def key(self, sample: str, agent_id: str, role: str) -> tuple:
+        """Returns the key of an agent's next call, counting the call."""
+        state = self._samples.get(sample)
+        if state is None:
+            state = self._samples[sample] = {"agents": {}, "roles": {}, "calls": {}}
+            if len(self._samples) > self.max_samples:
+                self._samples.popitem(last=False)
+        else:
+            self._samples.move_to_end(sample)
+
+        if agent_id not in state["agents"]:
+            index = state["roles"].get(role, 0)
+            state["roles"][role] = index + 1
+            state["agents"][agent_id] = (role, index)
+        role, index = state["agents"][agent_id]
+        ordinal = state["calls"].get(agent_id, 0)
+        state["calls"][agent_id] = ordinal + 1
+        return (sample, role, index, ordinal)
+
+    def lookup(self, key: tuple):
+        """Returns the recorded (digest, response) for a key, or None."""
+        return self._responses.get(key)
+
+    def record(self, key: tuple, digest: str, response: dict):
+        line = json.dumps(
+            [*key, digest, response], separators=(",", ":"), ensure_ascii=False
+        )
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,69 @@
+"""
+Per-model lanes of the gateway.
+
+Providers limit each model separately, so the gateway keeps a lane per model: its own
+queue (ordered by its own scheduling policy), request and token buckets and concurrency
+limit. A burst of requests for one model then neither waits behind, nor uses up the
+limits of, another: a system mixing cheap worker agents with a stronger final-decision
+agent runs each model at its own limit, in parallel.
+"""
+
+import asyncio
+import json
+import os
+
+from .concurrency import ConcurrencyLimit
+from .rate_limit import RateLimiter
+
+# Per-model limits as JSON, e.g. '{"gpt-4o": {"rpm": 500, "tpm": 30000, "concurrency": 50}}';
+# models without an entry (or limits without a value) use the gateway-wide defaults
+MODEL_LIMITS = json.loads(os.getenv("GATEWAY_MODEL_LIMITS", "{}"))
+
+
+class Lane:
+    """
+    The queue and limits of one model.
+
+    The rate limiter and the concurrency limit learnt so far outlive event loops, like
+    the provider's limits they track; the queue is bound to the loop the lane was started
+    on.
+
+    Attributes:
+        model (str): The model the lane's requests are for.
+        rate_limiter (RateLimiter): The model's request and token buckets.
+        concurrency (ConcurrencyLimit): The model's (adaptive) limit on calls in flight.
+        scheduling_policy: The order the lane's queued requests are dispatched in.
+        queue (asyncio.PriorityQueue): The lane's queued requests, by priority.
+        queued_tokens (int): The estimated tokens of the queued requests.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        concurrency: ConcurrencyLimit,
+        scheduling_policy,
+    ):
+        self.model = model
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.concurrency = concurrency
+        self.scheduling_policy = scheduling_policy
+        self.queue = None
+        self.queued_tokens = 0
+
+    def start(self):
+        """Binds the lane's queue and concurrency limit to the running event loop."""
+        # Unbounded so retries can always be queued again; admission bounds new requests
+        self.queue = asyncio.PriorityQueue()
+        self.queued_tokens = 0
+        self.concurrency.start()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queued_tokens": self.queued_tokens,
+            "requests_per_minute": self.rate_limiter.requests.capacity,
+            "tokens_per_minute": self.rate_limiter.tokens.capacity,
+            **self.concurrency.stats(),
+        }
@@ -0,0 +1,178 @@
+"""
+Counters, gauges and histograms in the Prometheus text exposition format.
+
+Just enough of a Prometheus client for the gateway's `/metrics` endpoint, without the
+dependency: recording a sample is a dictionary update (plus a bisection for histograms),
+so the metrics can stay on in production runs.
+"""
+
+import bisect
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from a cache-speed call to the longest a request may queue
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """
+    A metric family: one value per combination of its label values, which are passed as
+    keyword arguments, e.g. `retries.inc(model="gpt-4o", error="RateLimitError")`.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[name] for name in self.labels)
+
+    def samples(self):
+        """The metric's samples, as (name, label string, value)."""
+        # A copy, as `serve` may render while the gateway records
+        for key, value in list(self.values.items()):
+            yield self.name, _labels(self.labels, key), value
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {_format(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, value: float, **labels):
+        """Sets a counter kept elsewhere (e.g. a cache's hit count) at scrape time."""
+        self.values[self._key(labels)] = value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    """Counts observations into cumulative buckets, with their sum and count."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts = self.values.get(key)
+        if counts is None:
+            # Per-bucket (not yet cumulative) counts, then the sum
+            counts = self.values[key] = [0] * len(self.buckets) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self):
+        for key, counts in list(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_format(bound)}"'
+                yield f"{self.name}_bucket", _labels(self.labels, key, le), cumulative
+            yield f"{self.name}_sum", _labels(self.labels, key), counts[-1]
+            yield f"{self.name}_count", _labels(self.labels, key), cumulative
+
+
+class Registry:
+    """The metrics exposed together, rendered in the order they were created."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def _register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+def serve(render, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Serves `render()` at /metrics on `port` from a daemon thread, for processes (e.g.
+    evals using the in-process gateway) that do not run an HTTP server of their own.
+    Only the local host can connect, unless another `host` to bind to is given.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,273 @@
+"""
+A deterministic stand-in for the OpenAI API, for benchmarking the scaffold offline.
+
+`MockOpenAI` replaces the gateway's `openai.AsyncOpenAI` client (set GATEWAY_BACKEND=mock),
+so requests still go through the gateway's admission, scheduling, rate limiting, retries
+and cache. It answers `get_structured_response` function calls with values that fit each
+field's description of the `response_format` (e.g. "A single letter, A, B, C or D." gets a
+letter, "One of: physics, chemistry, ..." one of the options) and reports token usage,
+after a simulated latency and with optional injected failures. Everything is derived from
+a seeded hash of the request, so a run can be reproduced exactly.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+from collections import OrderedDict
+
+import httpx
+import openai
+from openai.types.chat import ChatCompletion
+
+DISTRIBUTIONS = ("constant", "exponential", "lognormal")
+
+# Like OpenAI's prompt caching: prompts are cached from 1024 tokens, in 128-token steps
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_INCREMENT = 128
+# The share of a call's latency spent processing the prompt, after which it is cached
+PREFILL_SHARE = 0.1
+
+
+class MockOpenAI:
+    """
+    Mimics `openai.AsyncOpenAI().chat.completions.create` for structured responses.
+
+    Attributes:
+        latency (float): The mean latency of a call, in seconds.
+        distribution (str): How latencies are distributed around the mean: "constant",
+            "exponential" or "lognormal" (with shape `sigma`).
+        error_rate (float): The fraction of calls failing with a 500 error.
+        rate_limit_rate (float): The fraction of calls failing with a 429 error.
+        capacity (int): The number of calls the provider serves at once, or None for no
+            limit; calls beyond it fail straight away with a 429 error.
+        missing_call_rate (float): The fraction of responses that do not call the function.
+        completion_tokens (int): The mean number of completion tokens reported.
+        prompt_cache (bool): Report the prompt tokens a provider would serve from its
+            prompt cache: the longest prefix, at message boundaries, of an earlier prompt.
+        seed (int): Seeds every random choice, together with the request.
+        calls (int): The number of calls made so far.
+        active (int): The number of calls being served.
+        rejected (int): The number of calls rejected for exceeding `capacity`.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        distribution: str = "lognormal",
+        sigma: float = 0.5,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        capacity: int = None,
+        missing_call_rate: float = 0.0,
+        completion_tokens: int = 150,
+        prompt_cache: bool = True,
+        seed: int = 0,
+        max_prefixes: int = 100_000,
+    ):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{distribution}'")
+        self.latency = latency
+        self.distribution = distribution
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.capacity = capacity
+        self.missing_call_rate = missing_call_rate
+        self.completion_tokens = completion_tokens
+        self.prompt_cache = prompt_cache
+        self.seed = seed
+        self.max_prefixes = max_prefixes
+        self.calls = 0
+        self.active = 0
+        self.rejected = 0
+        # How often each request has been made, so retries draw new outcomes
+        self._repeats = {}
+        # The prompt prefixes seen so far, by hash, with the time they are cached from;
+        # least recently used first
+        self._prefixes = OrderedDict()
+        self.chat = _Chat(self)
+
+    @classmethod
+    def from_env(cls):
+        """Configures the mock from MOCK_* environment variables."""
+        return cls(
+            latency=float(os.getenv("MOCK_LATENCY", 0.5)),
+            distribution=os.getenv("MOCK_LATENCY_DISTRIBUTION", "lognormal"),
+            sigma=float(os.getenv("MOCK_LATENCY_SIGMA", 0.5)),
+            error_rate=float(os.getenv("MOCK_ERROR_RATE", 0)),
+            rate_limit_rate=float(os.getenv("MOCK_RATE_LIMIT_RATE", 0)),
+            capacity=int(os.getenv("MOCK_CAPACITY", 0)) or None,
+            missing_call_rate=float(os.getenv("MOCK_MISSING_CALL_RATE", 0)),
+            completion_tokens=int(os.getenv("MOCK_COMPLETION_TOKENS", 150)),
+            prompt_cache=os.getenv("MOCK_PROMPT_CACHE", "1") != "0",
+            seed=int(os.getenv("MOCK_SEED", 0)),
+        )
+
+    def _rng(self, model: str, messages: list, functions: list) -> random.Random:
+        request = json.dumps([model, messages, functions], sort_keys=True)
+        key = hashlib.sha256(request.encode("utf-8")).hexdigest()
+        repeat = self._repeats.get(key, 0)
+        self._repeats[key] = repeat + 1
+        return random.Random(f"{self.seed}:{key}:{repeat}")
+
+    def _prefixes_of(self, model: str, messages: list, functions: list) -> list:
+        """The hash and token count of each prefix of a prompt, at message boundaries."""
+        # The function definitions come first in the prompt, as with OpenAI's tools
+        digest = hashlib.sha256(json.dumps([model, functions], sort_keys=True).encode())
+        prefixes = []
+        tokens = 0
+        for message in messages:
+            digest.update(json.dumps(message, sort_keys=True).encode("utf-8"))
+            tokens += 4 + len(str(message.get("content", ""))) // 4
+            prefixes.append((digest.hexdigest(), tokens))
+        return prefixes
+
+    def _cached_tokens(self, prefixes: list, now: float) -> int:
+        cached = 0
+        for prefix, tokens in prefixes:
+            if self._prefixes.get(prefix, math.inf) <= now:
+                self._prefixes.move_to_end(prefix)
+                cached = tokens
+        if cached < PROMPT_CACHE_MIN_TOKENS:
+            return 0
+        return cached // PROMPT_CACHE_INCREMENT * PROMPT_CACHE_INCREMENT
+
+    def _cache_prompt(self, prefixes: list, ready: float):
+        for prefix, _ in prefixes:
+            self._prefixes[prefix] = min(self._prefixes.get(prefix, ready), ready)
+            self._prefixes.move_to_end(prefix)
+        while len(self._prefixes) > self.max_prefixes:
+            self._prefixes.popitem(last=False)
+
+    def _delay(self, rng: random.Random) -> float:
+        if self.latency <= 0 or self.distribution == "constant":
+            return max(self.latency, 0.0)
+        if self.distribution == "exponential":
+            return rng.expovariate(1 / self.latency)
+        # Lognormal with mean `latency`
+        mu = math.log(self.latency) - self.sigma**2 / 2
+        return rng.lognormvariate(mu, self.sigma)
+
+    async def create(
+        self,
+        model: str,
+        messages: list,
+        temperature: float = 1.0,
+        functions: list = None,
+        function_call=None,
+        **kwargs,
+    ) -> ChatCompletion:
+        self.calls += 1
+        if self.capacity is not None and self.active >= self.capacity:
+            self.rejected += 1
+            raise _error(
+                openai.RateLimitError, 429, "Too many concurrent requests (mock)"
+            )
+        rng = self._rng(model, messages, functions)
+        delay = self._delay(rng)
+        # A prompt is only cached once it has been processed, so calls with the same
+        # prefix made at the same time miss
+        prefixes = (
+            self._prefixes_of(model, messages, functions) if self.prompt_cache else []
+        )
+        now = time.monotonic()
+        cached_tokens = self._cached_tokens(prefixes, now)
+        self._cache_prompt(prefixes, now + delay * PREFILL_SHARE)
+        self.active += 1
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.active -= 1
+
+        outcome = rng.random()
+        if outcome < self.rate_limit_rate:
+            raise _error(openai.RateLimitError, 429, "Rate limit reached (mock)")
+        if outcome < self.rate_limit_rate + self.error_rate:
+            raise _error(openai.InternalServerError, 500, "Server error (mock)")
+
+        # Approximated like `TokenCounter` without an encoding, to stay offline
+        prompt_tokens = sum(4 + len(str(m.get("content", ""))) // 4 for m in messages) + 2
+        completion_tokens = max(
+            1, round(rng.gauss(self.completion_tokens, self.completion_tokens / 4))
+        )
+
+        message = {"role": "assistant", "content": None}
+        if functions and rng.random() >= self.missing_call_rate:
+            function = functions[0]
+            properties = function["parameters"]["properties"]
+            arguments = {
+                name: fake_value(prop.get("description", ""), completion_tokens, rng)
+                for name, prop in properties.items()
+            }
+            message["function_call"] = {
+                "name": function["name"],
+                "arguments": json.dumps(arguments),
+            }
+        else:
+            message["content"] = "I think the answer is probably fine."
+
+        return ChatCompletion.model_validate(
+            {
+                "id": f"chatcmpl-mock-{self.calls}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {"index": 0, "finish_reason": "stop", "message": message}
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                    "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                },
+            }
+        )
+
+
+class _Chat:
+    def __init__(self, mock: MockOpenAI):
+        self.completions = mock
+
+
+def _error(cls, status_code: int, message: str):
+    response = httpx.Response(
+        status_code,
+        headers={"retry-after": "1"} if status_code == 429 else {},
+        request=httpx.Request("POST", "https://mock.invalid/v1/chat/completions"),
+    )
+    return cls(message, response=response, body=None)
+
+
+def fake_value(description: str, tokens: int, rng: random.Random) -> str:
+    """A plausible value for a response field, judged by its description."""
+    # "Either 'CORRECT' or 'INCORRECT'"
+    quoted = re.findall(r"'([^']+)'", description)
+    if description.lower().startswith("either") and quoted:
+        return rng.choice(quoted)
+
+    # "One of: physics, chemistry, biology, or general"
+    options = re.match(r"one of:?\s*(.+?)\.?$", description, re.IGNORECASE)
+    if options:
+        choices = [c.strip() for c in re.split(r",|\bor\b", options.group(1))]
+        return rng.choice([c for c in choices if c])
+
+    # "A single letter, A, B, C or D." / "... in the range A-D"
+    if "letter" in description.lower():
+        letters = re.findall(r"\b([A-Z])\b", description.replace("A single", ""))
+        span = re.search(r"\b([A-Z])-([A-Z])\b", description)
+        if span:
+            letters = [chr(c) for c in range(ord(span.group(1)), ord(span.group(2)) + 1)]
+        return rng.choice(letters or list("ABCD"))
+
+    if "number" in description.lower():
+        return str(rng.randint(0, 100))
+
+    # Free text, roughly `tokens` long
+    words = ("the", "answer", "follows", "because", "step", "therefore", "so", "we")
+    return " ".join(rng.choice(words) for _ in range(max(1, tokens * 3 // 4)))
@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    A bucket holding up to `capacity` units, refilled continuously so that `capacity`
+    units become available every `period` seconds.
+
+    The level may go negative when a charge is reconciled upwards, in which case the debt
+    is repaid by the refill before anything else is admitted.
+    """
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units (at most a full bucket) are available."""
+        self.refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def backlog_time(self, amount: float) -> float:
+        """Seconds until `amount` units (possibly many buckets' worth) have been available."""
+        self.refill()
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def consume(self, amount: float):
+        self.refill()
+        self.level -= amount
+
+    def credit(self, amount: float):
+        self.refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """
+    Admits requests against two token buckets: one counting requests per minute and one
+    counting tokens per minute.
+
+    Each request is charged its estimated token usage up front (prompt tokens plus the
+    expected completion tokens) and reconciled against the provider's reported usage once
+    it completes, so the gateway runs right at the configured limits without exceeding
+    them. `acquire` sleeps exactly until both buckets can admit the request rather than
+    polling.
+    """
+
+    def __init__(self, max_requests_per_minute: int, max_tokens_per_minute: int):
+        self.requests = TokenBucket(max_requests_per_minute)
+        self.tokens = TokenBucket(max_tokens_per_minute)
+
+    async def acquire(self, tokens: int):
+        """Waits until a request of `tokens` estimated tokens may be sent, and charges it."""
+        while True:
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if wait <= 0:
+                self.requests.consume(1)
+                self.tokens.consume(tokens)
+                return
+            await asyncio.sleep(wait)
+
+    def time_to_admit(self, requests: int, tokens: int) -> float:
+        """Estimated seconds until a backlog of requests and tokens has been admitted."""
+        return max(
+            self.requests.backlog_time(requests), self.tokens.backlog_time(tokens)
+        )
+
+    def reconcile(self, estimated_tokens: int, actual_tokens: int):
+        """Corrects the token bucket once a request's actual usage is known."""
+        difference = actual_tokens - estimated_tokens
+        if difference > 0:
+            self.tokens.consume(difference)
+        elif difference < 0:
+            self.tokens.credit(-difference)
@@ -0,0 +1,76 @@
+import json
+import random
+from typing import Optional
+
+import openai
+
+from .errors import MissingFunctionCall
+
+# Status codes worth retrying: request timeout, conflict, rate limit and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+def retry_after(exc: Exception) -> Optional[float]:
+    """The delay the provider asked for in its Retry-After(-ms) headers, if any."""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        # Retry-After may also be an HTTP date, which we treat as absent
+        pass
+    return None
+
+
+def is_retryable(exc: Exception) -> bool:
+    """
+    Classifies an error from a model call: transient failures (rate limits, timeouts,
+    connection and server errors, malformed structured responses) are retryable, while
+    errors in the request itself (bad request, authentication, exhausted quota) are not.
+    """
+    if isinstance(exc, (MissingFunctionCall, json.JSONDecodeError)):
+        return True
+    if isinstance(exc, openai.APIConnectionError):  # includes timeouts
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        if getattr(exc, "code", None) == "insufficient_quota":
+            return False
+        return exc.status_code in RETRYABLE_STATUS_CODES or exc.status_code >= 500
+    return False
+
+
+def is_congestion(exc: Exception) -> bool:
+    """Whether an error signals that the provider is overloaded: a rate limit or timeout."""
+    if isinstance(exc, openai.APITimeoutError):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        if getattr(exc, "code", None) == "insufficient_quota":
+            return False
+        return exc.status_code in (408, 429)
+    return False
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter: the n-th retry waits a random delay of up to
+    `base_delay * 2 ** (n - 1)` seconds (capped at `max_delay`), or longer if the provider
+    asked for it with Retry-After. Jitter keeps requests that failed together from retrying
+    together.
+    """
+
+    def __init__(self, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, exc: Exception) -> float:
+        """The delay before retrying a request whose `attempt`-th attempt failed with `exc`."""
+        backoff = random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        )
+        requested = retry_after(exc)
+        return max(backoff, requested) if requested is not None else backoff
@@ -0,0 +1,63 @@
+import heapq
+import random
+import types
+
+import pytest
+
+from chat import concurrency
+from chat.concurrency import ConcurrencyLimit
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A simulated clock, read by the limit in place of `time.monotonic`."""
+    now = [0.0]
+    monkeypatch.setattr(
+        concurrency, "time", types.SimpleNamespace(monotonic=lambda: now[0])
+    )
+    return now
+
+
+def simulate(limit, clock, calls, capacity=40, latency=0.1, slowdown=None, seed=0):
+    """
+    Runs `calls` calls through the limit against a provider that serves `capacity` at
+    once, taking lognormal latencies around `latency`, and rejects the rest with a 429.
+    `slowdown` (start, factor) multiplies the latency of calls started from then on.
+    Returns the limit after every completed call.
+    """
+    rng = random.Random(seed)
+    finishing = []
+    limits = []
+    while len(limits) < calls:
+        while limit.in_flight < int(limit.limit):
+            if len(finishing) >= capacity:
+                limit.failed(congestion=True)
+                break
+            limit.in_flight += 1
+            mean = latency
+            if slowdown is not None and len(limits) >= slowdown[0]:
+                mean *= slowdown[1]
+            seconds = mean * rng.lognormvariate(0, 0.5)
+            heapq.heappush(finishing, (clock[0] + seconds, seconds))
+        clock[0], seconds = heapq.heappop(finishing)
+        limit.in_flight -= 1
+        limit.succeeded(seconds)
+        limits.append(limit.limit)
+    return limits
+
+
+def test_limit_climbs_back_after_a_decrease(clock):
+    # The first calls to complete are the fastest of the burst, which once set a
+    # baseline that held the limit at half the provider's capacity for good
+    limit = ConcurrencyLimit(200, initial=32)
+    limits = simulate(limit, clock, 20_000)
+    assert limit.decisions["decrease"] >= 1
+    assert max(limits[-5000:]) >= 35
+
+
+def test_limit_holds_while_calls_slow_down(clock):
+    limit = ConcurrencyLimit(200, initial=32)
+    limits = simulate(limit, clock, 3000, capacity=1000, slowdown=(2000, 5))
+    # Growing until the provider slows down, then holding
+    assert limits[1999] > limits[0]
+    assert limits[-1] - limits[2100] < 1
@@ -0,0 +1,121 @@
+import asyncio
+import functools
+import hashlib
+from collections import OrderedDict
+
+import tiktoken
+
+# The encoding of the gateway's default model
+DEFAULT_ENCODING_NAME = "cl100k_base"
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(encoding_name: str) -> tiktoken.Encoding:
+    """Loads an encoding once per process."""
+    return tiktoken.get_encoding(encoding_name)
+
+
+@functools.lru_cache(maxsize=None)
+def shared_counter(encoding_name: str = None) -> "TokenCounter":
+    """One counter per encoding, so the gateway and the agents share their counts."""
+    return TokenCounter(encoding_name)
+
+
+class TokenCounter:
+    """
+    Counts the tokens of chat completion requests, caching the count of every message.
+
+    Histories built by `Agent.chat_history` only grow by appending, and system prompts and
+    shared prefixes recur across agents and samples, so almost every message of a request
+    has been counted before. Messages are keyed by a hash of their content (not the
+    content itself, which keeps the cache small) and the least recently used counts are
+    evicted beyond `max_entries`.
+
+    Without an `encoding_name` tokens are approximated as four characters each, which
+    needs no encoding download (e.g. for the offline mock backend).
+
+    Only the messages missing from the cache are encoded. When they add up to more than
+    `offload_chars` characters, `acount` encodes them on a worker thread (tiktoken releases
+    the GIL) so the event loop keeps admitting other requests.
+    """
+
+    def __init__(
+        self,
+        encoding_name: str = None,
+        max_entries: int = 100_000,
+        offload_chars: int = 50_000,
+    ):
+        self.encoding_name = encoding_name
+        self.max_entries = max_entries
+        self.offload_chars = offload_chars
+        self._counts = OrderedDict()
+
+    @staticmethod
+    def _key(message: dict) -> bytes:
+        digest = hashlib.blake2b(digest_size=16)
+        for value in message.values():
+            digest.update(value.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.digest()
+
+    def _lookup(self, messages: list):
+        """
+        Returns the total of the cached counts, the keys of the uncached messages (once
+        per occurrence) and those messages by key.
+        """
+        total = 0
+        uncached = []
+        missing = {}
+        for message in messages:
+            key = self._key(message)
+            count = self._counts.get(key)
+            if count is None:
+                uncached.append(key)
+                missing[key] = message
+            else:
+                self._counts.move_to_end(key)
+                total += count
+        return total, uncached, missing
+
+    def _encode(self, missing: dict) -> dict:
+        if self.encoding_name is None:
+            length = lambda value: len(value) // 4  # noqa: E731
+        else:
+            encode = get_encoding(self.encoding_name).encode_ordinary
+            length = lambda value: len(encode(value))  # noqa: E731
+
+        counts = {}
+        for key, message in missing.items():
+            # 4 tokens for role/name delim and message, plus tokens for content
+            counts[key] = 4 + sum(length(value) for value in message.values())
+        return counts
+
+    def _store(self, counts: dict):
+        self._counts.update(counts)
+        while len(self._counts) > self.max_entries:
+            self._counts.popitem(last=False)
+
+    def count(self, messages: list) -> int:
+        """Counts the tokens of a request, encoding any uncounted messages in place."""
+        total, uncached, missing = self._lookup(messages)
+        counts = self._encode(missing)
+        self._store(counts)
+        # every reply is primed with <im_start>assistant
+        return total + sum(counts[key] for key in uncached) + 2
+
+    def count_each(self, messages: list) -> list:
+        """Counts the tokens of each message, without the reply's priming."""
+        _, _, missing = self._lookup(messages)
+        self._store(self._encode(missing))
+        return [self._counts[self._key(message)] for message in messages]
+
+    async def acount(self, messages: list) -> int:
+        """Counts the tokens of a request, encoding large batches off the event loop."""
+        total, uncached, missing = self._lookup(messages)
+        size = sum(len(v) for message in missing.values() for v in message.values())
+        if size > self.offload_chars:
+            counts = await asyncio.to_thread(self._encode, missing)
+        else:
+            counts = self._encode(missing)
+        self._store(counts)
+        return total + sum(counts[key] for key in uncached) + 2
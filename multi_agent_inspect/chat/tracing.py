@@ -0,0 +1,217 @@
+"""
+Spans showing where a sample's time goes: the agents' own work (building chat histories,
+committing to the database), the transport to the gateway, queueing in the gateway and
+waiting for the model.
+
+Spans are tagged with the current `request_tags`: the task (the agent system), the
+sample and, within `Agent.forward`, the agent. The same tags travel with every request
+to the gateway (in the `/gpt` payload over HTTP), so the gateway's queue and upstream
+spans are attributed to the sample and agent that made the request.
+
+Tracing is off unless enabled with `enable_tracing` or TRACE_PATH:
+
+    enable_tracing("trace.json")  # written at exit; open in ui.perfetto.dev
+    ...
+    print(format_summary())  # time per agent system and kind of span, per sample
+"""
+
+import atexit
+import contextlib
+import json
+import os
+import time
+
+from .context import current_tags
+
+# The collecting tracer, or None while tracing is off
+tracer: "Tracer" = None
+
+# Where the trace is written at exit, if anywhere
+trace_path: str = None
+
+
+class Span:
+    __slots__ = ("name", "category", "start", "duration", "tags", "args")
+
+    def __init__(self, name, category, start, duration, tags, args):
+        self.name = name
+        self.category = category
+        self.start = start  # wall-clock seconds, comparable across processes
+        self.duration = duration
+        self.tags = tags
+        self.args = args
+
+
+class Tracer:
+    """
+    Collects spans in memory, up to `max_spans` (any further spans are only counted).
+
+    Attributes:
+        spans (list): The spans recorded, in the order they ended.
+        dropped (int): The number of spans not kept because `max_spans` was reached.
+    """
+
+    def __init__(self, max_spans: int = 1_000_000):
+        self.max_spans = max_spans
+        self.spans = []
+        self.dropped = 0
+
+    def record(
+        self,
+        name: str,
+        category: str,
+        start: float,
+        duration: float,
+        tags: dict,
+        **args,
+    ):
+        if len(self.spans) >= self.max_spans:
+            self.dropped += 1
+            return
+        self.spans.append(Span(name, category, start, duration, tags, args))
+
+    def chrome_trace(self) -> dict:
+        """
+        The spans in the Chrome trace event format: a process per agent system and a
+        thread per sample (and per agent within it).
+        """
+        events = []
+        processes = {}
+        threads = {}
+        for span in list(self.spans):
+            task = span.tags.get("task") or "untagged"
+            sample = span.tags.get("sample") or "no sample"
+            agent = span.tags.get("agent")
+            pid = processes.get(task)
+            if pid is None:
+                pid = processes[task] = len(processes) + 1
+                events.append(_metadata("process_name", pid, 0, task))
+            tid = threads.get((pid, sample, agent))
+            if tid is None:
+                tid = threads[(pid, sample, agent)] = len(threads) + 1
+                role = span.tags.get("role") or agent
+                name = f"{sample} {role}" if agent else sample
+                events.append(_metadata("thread_name", pid, tid, name))
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": round(span.start * 1e6),
+                    "dur": round(span.duration * 1e6),
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {**span.tags, **span.args},
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path: str):
+        """Writes the spans to `path` as a Chrome trace (chrome://tracing, Perfetto)."""
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def summary(self) -> dict:
+        """
+        The time spent in each kind of span, by agent system: the number of spans, their
+        total and longest duration, and the mean total per sample. Spans nest (e.g. the
+        gateway's within `forward`) and overlap across concurrent agents, so totals are
+        not additive.
+        """
+        systems = {}
+        for span in list(self.spans):
+            system = systems.setdefault(
+                span.tags.get("task") or "untagged", {"samples": set(), "spans": {}}
+            )
+            if span.tags.get("sample"):
+                system["samples"].add(span.tags["sample"])
+            stats = system["spans"].setdefault(
+                span.name, {"count": 0, "total": 0.0, "max": 0.0}
+            )
+            stats["count"] += 1
+            stats["total"] += span.duration
+            stats["max"] = max(stats["max"], span.duration)
+
+        for system in systems.values():
+            system["samples"] = samples = len(system["samples"])
+            for stats in system["spans"].values():
+                stats["per_sample"] = stats["total"] / samples if samples else None
+        return systems
+
+
+def _metadata(kind: str, pid: int, tid: int, name: str) -> dict:
+    return {"name": kind, "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+
+
+def enable_tracing(path: str = None, max_spans: int = 1_000_000) -> Tracer:
+    """
+    Starts collecting spans, discarding any collected so far. With a `path` the trace is
+    written there at exit. Also enabled by setting TRACE_PATH.
+    """
+    global tracer, trace_path
+    tracer = Tracer(max_spans)
+    if path is not None:
+        if trace_path is None:
+            atexit.register(_export_at_exit)
+        trace_path = path
+    return tracer
+
+
+def _export_at_exit():
+    if tracer is not None and trace_path is not None:
+        tracer.export(trace_path)
+
+
+@contextlib.contextmanager
+def span(name: str, category: str, tags: dict = None, **args):
+    """
+    Records the time spent in the block as a span tagged with the current request tags,
+    updated with `tags` if given. `args` are shown with the span in the trace.
+    """
+    if tracer is None:
+        yield
+        return
+    span_tags = current_tags() if tags is None else {**current_tags(), **tags}
+    start = time.time()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        tracer.record(
+            name, category, start, time.perf_counter() - started, span_tags, **args
+        )
+
+
+def record(name: str, category: str, duration: float, tags: dict, **args):
+    """Records a span of `duration` seconds that ended just now, timed elsewhere."""
+    if tracer is not None:
+        tracer.record(name, category, time.time() - duration, duration, tags, **args)
+
+
+def format_summary() -> str:
+    """The tracer's `summary` as a table, one section per agent system."""
+    if tracer is None:
+        return "Tracing is off."
+    lines = []
+    for system, summary in tracer.summary().items():
+        lines.append(f"{system} ({summary['samples']} samples)")
+        lines.append(
+            f"  {'span':<14} {'count':>7} {'total s':>9} "
+            f"{'per sample s':>13} {'max s':>8}"
+        )
+        for name, stats in sorted(
+            summary["spans"].items(), key=lambda item: -item[1]["total"]
+        ):
+            per_sample = stats["per_sample"]
+            lines.append(
+                f"  {name:<14} {stats['count']:>7} {stats['total']:>9.2f} "
+                f"{per_sample if per_sample is not None else float('nan'):>13.3f} "
+                f"{stats['max']:>8.3f}"
+            )
+    if tracer.dropped:
+        lines.append(f"({tracer.dropped} spans dropped beyond {tracer.max_spans})")
+    return "\n".join(lines)
+
+
+if os.getenv("TRACE_PATH"):
+    enable_tracing(os.getenv("TRACE_PATH"))
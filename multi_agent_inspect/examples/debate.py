@@ -38,45 +38,26 @@ class DebateAgentSystem:
 
         max_round = 2  # Maximum number of debate rounds
 
-        # Perform debate rounds
+        # Perform debate rounds; within a round every agent answers the same state of the
+        # debate, so they all speak at once
         for r in range(max_round):
-            for i in range(len(debate_agents)):
-                if r == 0 and i == 0:
-                    meeting.chats.append(
-                        self.Chat(
-                            agent=system,
-                            content=f"Please think step by step and then solve the task: {task}",
-                        )
-                    )
-                    output = await debate_agents[i].forward(
-                        response_format={
-                            "thinking": "Your step by step thinking.",
-                            "response": "Your final response.",
-                            "answer": "A single letter, A, B, C or D.",
-                        }
-                    )
-
-                else:
-                    meeting.chats.append(
-                        self.Chat(
-                            agent=system,
-                            content=f"Given solutions to the problem from other agents, consider their opinions as additional advice. Please think carefully and provide an updated answer. Reminder, the task is: {task}",
-                        )
-                    )
-                    output = await debate_agents[i].forward(
-                        response_format={
-                            "thinking": "Your step by step thinking.",
-                            "response": "Your final response.",
-                            "answer": "A single letter, A, B, C or D.",
-                        }
-                    )
-
-                meeting.chats.append(
-                    self.Chat(
-                        agent=debate_agents[i],
-                        content=output["thinking"] + output["response"],
-                    )
-                )
+            if r == 0:
+                instruction = f"Please think step by step and then solve the task: {task}"
+            else:
+                instruction = f"Given solutions to the problem from other agents, consider their opinions as additional advice. Please think carefully and provide an updated answer. Reminder, the task is: {task}"
+            meeting.chats.append(self.Chat(agent=system, content=instruction))
+
+            await meeting.fan_out(
+                debate_agents,
+                response_format={
+                    "thinking": "Your step by step thinking.",
+                    "response": "Your final response.",
+                    "answer": "A single letter, A, B, C or D.",
+                },
+                publish=lambda agent, output: self.Chat(
+                    agent=agent, content=output["thinking"] + output["response"]
+                ),
+            )
 
         # Make the final decision based on all debate results and solutions
         meeting.chats.append(
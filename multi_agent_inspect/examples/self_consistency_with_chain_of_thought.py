@@ -1,23 +1,102 @@
 import asyncio
+import math
+from collections import Counter
 
 from base import Agent, Meeting, Chat, Wrapper
 
 from sqlalchemy.orm import Session
 
+RESPONSE_FORMAT = {
+    "thinking": "Your step by step thinking.",
+    "answer": "A single letter, A, B, C or D.",
+}
+
+
+def majority_is_certain(counts: Counter, remaining: int) -> bool:
+    """Whether the leading answer can no longer be overtaken, or tied, by `remaining` votes."""
+    votes = [count for _, count in counts.most_common(2)] + [0]
+    return votes[0] > votes[1] + remaining
+
+
+def leader_confidence(counts: Counter) -> float:
+    """
+    The probability that the leading answer is more likely than the runner-up, given
+    their votes so far: P(p1 > p2) with a uniform prior on p1 / (p1 + p2), i.e.
+    P(Beta(v1 + 1, v2 + 1) > 1/2), which for whole counts is a binomial tail.
+    """
+    votes = [count for _, count in counts.most_common(2)] + [0]
+    n = votes[0] + votes[1] + 1
+    return sum(math.comb(n, k) for k in range(votes[0] + 1)) / 2**n
+
+
+def is_settled(counts: Counter, remaining: int, confidence: float) -> bool:
+    """Whether voting can stop, with `remaining` votes of the budget left to draw."""
+    if majority_is_certain(counts, remaining):
+        return True
+    return leader_confidence(counts) >= confidence
+
+
+def leading_answer(counts: Counter, first_voter: dict) -> str:
+    """
+    The answer with the most votes. Ties go to the answer first voted for by the
+    lowest-numbered agent (`first_voter` maps answers to it), as in fixed voting.
+    """
+    return min(counts, key=lambda answer: (-counts[answer], first_voter[answer]))
+
 
 class SelfConsistencyAgentSystem:
+    """
+    Draws N chain-of-thought answers and returns the most common one.
+
+    With `adaptive` set, voting stops as soon as the leading answer can't be overtaken
+    by the rest of the budget or its `leader_confidence` reaches `confidence`; answers
+    still outstanding are cancelled, which the gateway stops calling the model for.
+    At most `parallel` answers (within the budget) are drawn ahead of the votes counted,
+    and the votes are counted in the agents' order so the outcome doesn't depend on
+    which answer arrived first. A narrow `parallel` saves the most calls but draws the
+    answers in rounds; one close to N stops sooner than fixed voting, which waits for
+    all N answers, but saves few calls. `totals` counts the calls answered against the
+    budget, see `report`.
+    """
+
+    N = 3  # Number of CoT agents (the budget, when voting adaptively)
+    adaptive = False
+    parallel = 4
+    confidence = 0.95
+    totals = Counter()
+
     def __init__(self, session: Session):
         self.Agent = Wrapper(Agent, session)
         self.Meeting = Wrapper(Meeting, session)
         self.Chat = Wrapper(Chat, session)
         self.session = session
 
+    @classmethod
+    def report(cls) -> str:
+        """
+        Summarises the calls answered, and saved, across every sample so far. Only calls
+        never drawn count as saved: a cancelled call may already have reached the model.
+        """
+        totals = cls.totals
+        saved = totals["budget"] - totals["calls"] - totals["cancelled"]
+        return (
+            f"{cls.__name__}: {totals['calls']} calls answered over "
+            f"{totals['samples']} samples "
+            f"({totals['calls'] / max(totals['samples'], 1):.2f} per sample), "
+            f"{saved} of {totals['budget']} budgeted calls never made "
+            f"({saved / max(totals['budget'], 1):.0%}), "
+            f"{totals['cancelled']} more cancelled before answering"
+        )
+
     async def forward(self, task: str) -> str:
         # Create a system agent to provide instructions
         system = self.Agent(agent_name="system", temperature=0.8)
 
+        if self.adaptive:
+            return await self.vote_adaptively(task, system)
+
         # Create multiple CoT agents with higher temperature for varied reasoning
-        N = 3  # Number of CoT agents
+        N = self.N
         cot_agents = [
             self.Agent(agent_name=f"Chain-of-Thought Agent {i}", temperature=0.8)
             for i in range(N)
@@ -27,37 +106,102 @@ class SelfConsistencyAgentSystem:
         meeting = self.Meeting(meeting_name="self-consistency")
         meeting.agents.extend([system] + cot_agents)
 
-        # Collect answers from all agents
-        possible_answers = []
-        for i in range(N):
-            # Add system instruction
-            meeting.chats.append(
-                self.Chat(
-                    agent=system,
-                    content=f"Please think step by step and then solve the task: {task}",
-                )
+        # Add system instruction
+        meeting.chats.append(
+            self.Chat(
+                agent=system,
+                content=f"Please think step by step and then solve the task: {task}",
             )
+        )
+
+        # Collect answers from all agents at once, each reasoning independently, and
+        # record their responses
+        outputs = await meeting.fan_out(
+            cot_agents,
+            RESPONSE_FORMAT,
+            publish=lambda agent, output: self.Chat(
+                agent=agent, content=output["thinking"]
+            ),
+        )
+        possible_answers = [output["answer"] for output in outputs]
 
-            # Get response from current COT agent
-            output = await cot_agents[i].forward(
-                response_format={
-                    "thinking": "Your step by step thinking.",
-                    "answer": "A single letter, A, B, C or D.",
-                }
+        # Select the most common answer through majority voting
+        final_answer = Counter(possible_answers).most_common(1)[0][0]
+        self.totals.update(samples=1, budget=N, calls=N)
+        return final_answer
+
+    async def vote_adaptively(self, task: str, system) -> str:
+        meeting = self.Meeting(meeting_name="self-consistency")
+        meeting.agents.append(system)
+
+        # Every CoT agent answers the same instruction independently; their answers are
+        # only published to the meeting once voting is over
+        meeting.chats.append(
+            self.Chat(
+                agent=system,
+                content=f"Please think step by step and then solve the task: {task}",
+            )
+        )
+
+        agents = []
+        calls = []
+        answers = []
+        counts = Counter()
+        first_voter = {}
+
+        def launch():
+            i = len(calls)
+            agent = self.Agent(agent_name=f"Chain-of-Thought Agent {i}", temperature=0.8)
+            meeting.agents.append(agent)
+            agents.append(agent)
+            # Distinct samples, so the gateway doesn't serve them one shared response
+            calls.append(
+                asyncio.ensure_future(
+                    agent.forward(response_format=RESPONSE_FORMAT, sample=i)
+                )
             )
 
-            # Record the agent's response
-            meeting.chats.append(
-                self.Chat(agent=cot_agents[i], content=output["thinking"])
+        try:
+            while len(answers) < self.N:
+                while len(calls) < min(self.N, len(answers) + self.parallel):
+                    launch()
+
+                # Votes are counted in the agents' order, however their answers arrive,
+                # so the vote (and a replay of it) doesn't depend on timing
+                i = len(answers)
+                output = await calls[i]
+                answers.append((agents[i], output))
+                counts[output["answer"]] += 1
+                first_voter.setdefault(output["answer"], i)
+                if is_settled(counts, self.N - len(answers), self.confidence):
+                    break
+        finally:
+            outstanding = calls[len(answers) :]
+            cancelled = sum(not call.done() for call in outstanding)
+            for call in outstanding:
+                call.cancel()
+            await asyncio.gather(*outstanding, return_exceptions=True)
+            # Calls cancelled before answering are abandoned by the gateway
+            self.totals.update(
+                samples=1,
+                budget=self.N,
+                calls=len(calls) - cancelled,
+                cancelled=cancelled,
             )
 
-            possible_answers.append(output["answer"])
+        # Record the answers that were voted on
+        for agent, output in answers:
+            meeting.chats.append(self.Chat(agent=agent, content=output["thinking"]))
 
-        # Select the most common answer through majority voting
-        from collections import Counter
+        return leading_answer(counts, first_voter)
 
-        final_answer = Counter(possible_answers).most_common(1)[0][0]
-        return final_answer
+
+class AdaptiveSelfConsistencyAgentSystem(SelfConsistencyAgentSystem):
+    """Self-consistency with a larger budget, stopping as soon as the vote is settled."""
+
+    N = 16
+    adaptive = True
+    totals = Counter()
 
 
 if __name__ == "__main__":
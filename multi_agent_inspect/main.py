@@ -1,6 +1,7 @@
 from multiprocessing import Process
 from mmlu import EvaluateMMLU
 from base import initialize_session
+from chat import TRANSPORT
 from chat.api import app
 import uvicorn
 import time
@@ -60,24 +61,26 @@ def main():
 
 if __name__ == "__main__":
 
-    # Check if the OpenAI key is set in the .env file
-    if not (openai_key := os.getenv("OPENAI_API_KEY")):
+    # Check if the OpenAI key is set in the .env file (unless running against the mock)
+    if os.getenv("GATEWAY_BACKEND") != "mock" and not os.getenv("OPENAI_API_KEY"):
         raise ValueError("Please set the OPENAI_API_KEY in the .env file.")
 
-    # Start the API in a separate process
-    api_process = Process(target=run_api)
-    api_process.start()
+    # The in-process transport runs the gateway on the eval's own event loop
+    if TRANSPORT == "http":
+        # Start the API in a separate process
+        api_process = Process(target=run_api)
+        api_process.start()
 
-    # Ensure the API process is terminated when the script exits
-    def cleanup():
-        print("Shutting down API process...")
-        api_process.terminate()
-        api_process.join()
+        # Ensure the API process is terminated when the script exits
+        def cleanup():
+            print("Shutting down API process...")
+            api_process.terminate()
+            api_process.join()
 
-    atexit.register(cleanup)
+        atexit.register(cleanup)
 
-    # Allow API to initialize before running main
-    time.sleep(2)
+        # Allow API to initialize before running main
+        time.sleep(2)
 
     # Run the main function
     main()
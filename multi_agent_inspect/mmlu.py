@@ -17,7 +17,10 @@ from inspect_ai._eval.eval import eval
 
 from typing import Any, Literal, Union
 from textwrap import dedent
-from base import initialize_session
+from base import open_storage, get_writer
+from chat import format_summary, request_tags, span, tracing
+
+DB_NAME = "test.db"
 
 
 class EvaluateMMLU:
@@ -37,6 +40,9 @@ class EvaluateMMLU:
         split: Union[Literal["test"], Literal["dev"], Literal["validation"]] = "test",
         shuffle: bool = False,
         subjects: Union[list[str], str] = [],
+        storage: Literal["orm", "memory", "hybrid", "async"] = "orm",
+        batch_writes: bool = True,
+        write_behind: bool = False,
     ) -> Dataset:
         """
         Initialize the EvaluateMMLU class.
@@ -51,6 +57,21 @@ class EvaluateMMLU:
         subjects : Union[list[str], str], optional
             List of subjects to filter the dataset by. If empty, no filtering is applied.
             Defaults to [].
+        storage : str, optional
+            Where the agents, meetings and chats of each sample live. "orm" stores them
+            as SQLAlchemy models in the database, "memory" keeps plain in-memory objects
+            without persisting them, and "hybrid" keeps them in memory and persists them
+            asynchronously at the end of each sample. "async" stores SQLAlchemy models
+            through an AsyncSession (aiosqlite) so database I/O never blocks the event
+            loop. Defaults to "orm".
+        batch_writes : bool, optional
+            Whether to batch each sample's database writes in a `UnitOfWork` instead of
+            committing every Agent, Meeting and Chat as it is created. Only applies to
+            the "orm" storage. Defaults to True.
+        write_behind : bool, optional
+            Whether to open the database in WAL mode and hand every sample's writes to a
+            single background writer, so database I/O never blocks the event loop.
+            Only applies to the "orm" storage. Defaults to False.
 
         Returns
         -------
@@ -67,6 +88,10 @@ class EvaluateMMLU:
             seed=42,
         )
 
+        self.storage = storage
+        self.batch_writes = batch_writes
+        self.write_behind = write_behind
+
         # filter dataset if requested
         subjects = subjects if isinstance(subjects, list) else [subjects]
         if len(subjects) > 0:
@@ -145,19 +170,26 @@ class EvaluateMMLU:
 
         async def solve(state: TaskState, generate: Generate) -> TaskState:
 
+            # Tag the sample's LLM calls so the gateway can schedule them fairly
+            system_name = agent_system.__name__
+            sample = f"{system_name}/{state.sample_id}/{state.epoch}"
+
             try:
-                session, Base = initialize_session("test.db")
-                system = agent_system(session)
-                task = state.input
-                state.output.completion = await system.forward(task)
+                # Tagged outside the storage, so its final commit is the sample's too
+                with request_tags(task=system_name, sample=sample), span(
+                    "sample", "eval"
+                ):
+                    async with open_storage(
+                        self.storage, DB_NAME, self.batch_writes, self.write_behind
+                    ) as storage:
+                        system = agent_system(storage)
+                        task = state.input
+                        state.output.completion = await system.forward(task)
 
             except Exception as e:
 
                 print("Error during evaluation:", e)
 
-            finally:
-                session.close()
-
             return state
 
         return solve
@@ -210,6 +242,14 @@ class EvaluateMMLU:
             score=True,  # ensure scoring is enable
         )
 
+        if self.write_behind or self.storage == "hybrid":
+            # Make sure every sample's writes have reached the database
+            get_writer(DB_NAME).flush()
+
+        if tracing.tracer is not None:
+            # Where each agent system's samples spent their time
+            print(format_summary())
+
         # 'results' is a list of EvalLog objects (usually one per task)
         # Each EvalLog contains metrics for the entire task/dataset.
         accuracy = -2
@@ -256,4 +296,12 @@ class EvaluateMMLU:
             score=True,  # ensure scoring is enable
         )
 
+        if self.write_behind or self.storage == "hybrid":
+            # Make sure every sample's writes have reached the database
+            get_writer(DB_NAME).flush()
+
+        if tracing.tracer is not None:
+            # Where each agent system's samples spent their time
+            print(format_summary())
+
         print(results)